@@ -75,6 +75,39 @@ def verify_firebase_token(token: str):
 # Initialize Storage client
 storage_client = storage.Client()
 
+# CORS headers are identical for every response; build them once per endpoint
+FILE_CORS_HEADERS = {
+    'Access-Control-Allow-Origin': '*',
+    'Access-Control-Allow-Methods': 'GET, POST, OPTIONS',
+    'Access-Control-Allow-Headers': 'Content-Type, Authorization'
+}
+FILE_CORS_PREFLIGHT_HEADERS = {**FILE_CORS_HEADERS, 'Access-Control-Max-Age': '3600'}
+
+METADATA_CORS_HEADERS = {
+    'Access-Control-Allow-Origin': '*',
+    'Access-Control-Allow-Methods': 'GET, OPTIONS',
+    'Access-Control-Allow-Headers': 'Content-Type, Authorization'
+}
+METADATA_CORS_PREFLIGHT_HEADERS = {**METADATA_CORS_HEADERS, 'Access-Control-Max-Age': '3600'}
+
+# Fallback content types for extensions mimetypes may not know about
+DEFAULT_CONTENT_TYPES = {
+    '.pdf': 'application/pdf',
+    '.txt': 'text/plain',
+    '.docx': 'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
+    '.json': 'application/json',
+}
+
+# Size of each chunk read from GCS while streaming a file to the client
+STREAM_CHUNK_SIZE = 1024 * 1024
+
+def stream_blob(blob_file, first_chunk):
+    """Yield an open blob in chunks, starting with the chunk already read, so large files are never held fully in memory"""
+    with blob_file:
+        yield first_chunk
+        while chunk := blob_file.read(STREAM_CHUNK_SIZE):
+            yield chunk
+
 @functions_framework.http
 def storage_access(request):
     """
@@ -84,19 +117,9 @@ def storage_access(request):
     
     # CORS handling
     if request.method == 'OPTIONS':
-        headers = {
-            'Access-Control-Allow-Origin': '*',
-            'Access-Control-Allow-Methods': 'GET, POST, OPTIONS',
-            'Access-Control-Allow-Headers': 'Content-Type, Authorization',
-            'Access-Control-Max-Age': '3600'
-        }
-        return ('', 204, headers)
+        return ('', 204, FILE_CORS_PREFLIGHT_HEADERS)
     
-    headers = {
-        'Access-Control-Allow-Origin': '*',
-        'Access-Control-Allow-Methods': 'GET, POST, OPTIONS',
-        'Access-Control-Allow-Headers': 'Content-Type, Authorization'
-    }
+    headers = FILE_CORS_HEADERS
     
     # --- Authentication Check ---
     auth_header = request.headers.get('Authorization')
@@ -132,45 +155,42 @@ def storage_access(request):
         # Get the bucket and blob
         try:
             bucket = storage_client.bucket(bucket_name)
-            blob = bucket.blob(blob_path)
             
-            # Check if blob exists
-            if not blob.exists():
+            # Fetch blob metadata (size, generation); returns None if the blob does not exist
+            blob = bucket.get_blob(blob_path)
+            if blob is None:
                 logging.warning(f"File not found: {gcs_uri}")
                 return (jsonify({'error': 'File not found'}), 404, headers)
             
-            # Download the file content
-            file_content = blob.download_as_bytes()
-            
             # Determine content type
             content_type, _ = mimetypes.guess_type(blob_path)
             if not content_type:
                 # Default content types based on extension
-                if blob_path.lower().endswith('.pdf'):
-                    content_type = 'application/pdf'
-                elif blob_path.lower().endswith('.txt'):
-                    content_type = 'text/plain'
-                elif blob_path.lower().endswith('.docx'):
-                    content_type = 'application/vnd.openxmlformats-officedocument.wordprocessingml.document'
-                elif blob_path.lower().endswith('.json'):
-                    content_type = 'application/json'
-                else:
-                    content_type = 'application/octet-stream'
+                extension = os.path.splitext(blob_path)[1].lower()
+                content_type = DEFAULT_CONTENT_TYPES.get(extension, 'application/octet-stream')
             
             # Get filename from path
             filename = os.path.basename(blob_path)
             
-            # Update headers for file download
-            headers.update({
+            # Extend the shared CORS headers for the file download
+            file_headers = {
+                **headers,
                 'Content-Type': content_type,
                 'Content-Disposition': f'inline; filename="{filename}"',
-                'Content-Length': str(len(file_content)),
                 'Cache-Control': 'public, max-age=3600'  # Cache for 1 hour
-            })
+            }
+            
+            # Open the blob and read the first chunk before responding, so read failures still return a 500
+            blob_file = blob.open("rb", chunk_size=STREAM_CHUNK_SIZE)
+            try:
+                first_chunk = blob_file.read(STREAM_CHUNK_SIZE)
+            except Exception:
+                blob_file.close()
+                raise
             
-            logging.info(f"Successfully retrieved file: {filename} ({len(file_content)} bytes)")
+            logging.info(f"Streaming file: {filename} ({blob.size} bytes stored)")
             
-            return (file_content, 200, headers)
+            return Response(stream_blob(blob_file, first_chunk), 200, file_headers)
             
         except Exception as e:
             logging.error(f"Error accessing storage: {str(e)}")
@@ -190,19 +210,9 @@ def storage_access_metadata(request):
     
     # CORS handling
     if request.method == 'OPTIONS':
-        headers = {
-            'Access-Control-Allow-Origin': '*',
-            'Access-Control-Allow-Methods': 'GET, OPTIONS',
-            'Access-Control-Allow-Headers': 'Content-Type, Authorization',
-            'Access-Control-Max-Age': '3600'
-        }
-        return ('', 204, headers)
+        return ('', 204, METADATA_CORS_PREFLIGHT_HEADERS)
     
-    headers = {
-        'Access-Control-Allow-Origin': '*',
-        'Access-Control-Allow-Methods': 'GET, OPTIONS',
-        'Access-Control-Allow-Headers': 'Content-Type, Authorization'
-    }
+    headers = METADATA_CORS_HEADERS
     
     # --- Authentication Check ---
     auth_header = request.headers.get('Authorization')
@@ -13,7 +13,6 @@
 # limitations under the License.
 
 import os
-import json
 import asyncio
 import logging
 import threading
@@ -32,6 +31,7 @@ from google.cloud.speech_v2 import types
 import google.auth
 import firebase_admin
 from firebase_admin import auth, credentials
+import orjson
 
 # Load environment variables
 # Load base .env file first
@@ -64,6 +64,18 @@ except Exception as e:
 ALLOWED_DOMAINS = set(os.environ.get('AUTH_ALLOWED_DOMAINS', '').split(',')) if os.environ.get('AUTH_ALLOWED_DOMAINS') else set()
 ALLOWED_EMAILS = set(os.environ.get('AUTH_ALLOWED_EMAILS', '').split(',')) if os.environ.get('AUTH_ALLOWED_EMAILS') else set()
 
+def json_loads(data):
+    """Decode JSON from str or bytes"""
+    return orjson.loads(data)
+
+def json_dumps(obj) -> str:
+    """Encode an object as compact JSON text"""
+    return orjson.dumps(obj).decode('utf-8')
+
+async def send_json_message(websocket: WebSocket, data: dict):
+    """Send a JSON text frame to the client"""
+    await websocket.send_text(json_dumps(data))
+
 def is_email_authorized(email: str) -> bool:
     """Check if email is authorized based on domain or explicit allowlist"""
     if not email:
@@ -101,7 +113,8 @@ security = HTTPBearer()
 
 async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
     """Dependency to verify Firebase authentication"""
-    decoded_token = verify_firebase_token(credentials.credentials)
+    # Token verification is blocking network/crypto work; keep it off the event loop
+    decoded_token = await asyncio.to_thread(verify_firebase_token, credentials.credentials)
     if not decoded_token:
         raise HTTPException(status_code=401, detail="Invalid or unauthorized token")
     return decoded_token
@@ -122,73 +135,120 @@ if not project_id:
 logger.info(f"Using Google Cloud project: {project_id}")
 location = "global"
 
-# Initialize Speech client
+# Initialize Speech client; every session streams over this client's single gRPC channel
 speech_client = speech_v2.SpeechClient()
+RECOGNIZER_NAME = f"projects/{project_id}/locations/{location}/recognizers/_"
+
+# Speech v2 rejects streaming requests carrying more than 15 KB of audio
+MAX_AUDIO_REQUEST_BYTES = 15 * 1024
+
+def build_streaming_config(interim_results: bool) -> types.StreamingRecognitionConfig:
+    """Build a streaming recognition config optimized for low latency"""
+    return types.StreamingRecognitionConfig(
+        config=types.RecognitionConfig(
+            # Auto-detect encoding from browser
+            auto_decoding_config=types.AutoDetectDecodingConfig(),
+            language_codes=["en-US"],
+            model="latest_long",  # Best model for medical/therapy conversations
+            features=types.RecognitionFeatures(
+                enable_automatic_punctuation=True,
+                profanity_filter=False,
+                enable_word_time_offsets=True,
+                enable_word_confidence=True,
+                # Note: Speaker diarization not supported in streaming
+                # The LLM will identify speakers from context
+                max_alternatives=1,
+            ),
+        ),
+        streaming_features=types.StreamingRecognitionFeatures(
+            interim_results=interim_results,  # Critical for low latency
+            enable_voice_activity_events=True,
+            voice_activity_timeout=types.StreamingRecognitionFeatures.VoiceActivityTimeout(
+                speech_start_timeout={"seconds": 30},  # Wait longer for initial speech
+                speech_end_timeout={"seconds": 6},      # Natural pause between segments
+            ),
+        ),
+    )
+
+# Configs are identical across sessions apart from interim results, so build both variants once
+STREAMING_CONFIGS = {
+    interim_results: build_streaming_config(interim_results)
+    for interim_results in (True, False)
+}
 
 class StreamingTranscriptionSession:
     """Manages a true streaming transcription session with low latency"""
     
-    def __init__(self, session_id: str, websocket: WebSocket):
+    # Attributes are read on every audio chunk and response; slots make those lookups cheaper
+    __slots__ = (
+        "session_id",
+        "websocket",
+        "interim_results",
+        "is_active",
+        "audio_queue",
+        "response_queue",
+        "streaming_thread",
+        "last_interim_transcripts",
+        "main_loop",
+    )
+    
+    def __init__(self, session_id: str, websocket: WebSocket, interim_results: bool = True):
         self.session_id = session_id
         self.websocket = websocket
+        # Clients that only consume final transcripts can opt out of interim results entirely
+        self.interim_results = interim_results
         self.is_active = True
-        self.recognizer_name = f"projects/{project_id}/locations/{location}/recognizers/_"
         # Use thread-safe queue for audio data
         self.audio_queue = queue.Queue()
         self.response_queue = asyncio.Queue()
         self.streaming_thread = None
+        # Last interim transcript sent for each result index, so unchanged interim updates are not resent
+        self.last_interim_transcripts = {}
         # Store the main event loop for cross-thread communication
         self.main_loop = asyncio.get_event_loop()
         
-    def get_streaming_config(self) -> types.StreamingRecognitionConfig:
-        """Get streaming recognition config optimized for low latency"""
-        return types.StreamingRecognitionConfig(
-            config=types.RecognitionConfig(
-                # Auto-detect encoding from browser
-                auto_decoding_config=types.AutoDetectDecodingConfig(),
-                language_codes=["en-US"],
-                model="latest_long",  # Best model for medical/therapy conversations
-                features=types.RecognitionFeatures(
-                    enable_automatic_punctuation=True,
-                    profanity_filter=False,
-                    enable_word_time_offsets=True,
-                    enable_word_confidence=True,
-                    # Note: Speaker diarization not supported in streaming
-                    # The LLM will identify speakers from context
-                    max_alternatives=1,
-                ),
-            ),
-            streaming_features=types.StreamingRecognitionFeatures(
-                interim_results=True,  # Critical for low latency
-                enable_voice_activity_events=True,
-                voice_activity_timeout=types.StreamingRecognitionFeatures.VoiceActivityTimeout(
-                    speech_start_timeout={"seconds": 30},  # Wait longer for initial speech
-                    speech_end_timeout={"seconds": 6},      # Natural pause between segments
-                ),
-            ),
-        )
-    
     def audio_generator(self) -> Generator[types.StreamingRecognizeRequest, None, None]:
         """Synchronous generator for streaming requests"""
         # First request contains config
         yield types.StreamingRecognizeRequest(
-            recognizer=self.recognizer_name,
-            streaming_config=self.get_streaming_config(),
+            recognizer=RECOGNIZER_NAME,
+            streaming_config=STREAMING_CONFIGS[self.interim_results],
         )
         
         # Subsequent requests contain audio
+        pending = None
         while self.is_active:
             try:
-                # Get audio from queue with timeout (blocking)
-                audio_data = self.audio_queue.get(timeout=0.1)
+                # Block until audio arrives; stop() always enqueues a poison pill to wake us
+                audio_data = pending if pending is not None else self.audio_queue.get()
+                pending = None
                 
                 if audio_data is None:  # Poison pill to stop
                     break
-                    
-                yield types.StreamingRecognizeRequest(audio=audio_data)
                 
-            except queue.Empty:
-                continue
+                # Coalesce chunks that queued up while the previous request was in flight
+                # into one request, staying under the per-request audio size limit
+                chunks = [audio_data]
+                total_size = len(audio_data)
+                while total_size < MAX_AUDIO_REQUEST_BYTES:
+                    try:
+                        next_chunk = self.audio_queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if next_chunk is None:
+                        # Send what we have, then stop on the next iteration
+                        self.is_active = False
+                        break
+                    if total_size + len(next_chunk) > MAX_AUDIO_REQUEST_BYTES:
+                        pending = next_chunk
+                        break
+                    chunks.append(next_chunk)
+                    total_size += len(next_chunk)
+                
+                yield types.StreamingRecognizeRequest(
+                    audio=chunks[0] if len(chunks) == 1 else b"".join(chunks)
+                )
+                
             except Exception as e:
                 logger.error(f"Error in audio generator: {e}")
                 break
@@ -210,89 +270,126 @@ class StreamingTranscriptionSession:
             for response in responses:
                 response_count += 1
                 logger.debug(f"Received response #{response_count}")
-                # Put response in async queue for WebSocket processing
-                asyncio.run_coroutine_threadsafe(
-                    self.response_queue.put(response),
-                    self.main_loop
-                )
+                # Hand the response to the event loop without waiting on it; the queue is
+                # unbounded, so put_nowait never blocks and no coroutine/future is needed
+                self.main_loop.call_soon_threadsafe(self.response_queue.put_nowait, response)
                 
         except Exception as e:
             logger.error(f"Streaming thread error: {e}", exc_info=True)
             # Put error in response queue using the main loop
-            asyncio.run_coroutine_threadsafe(
-                self.response_queue.put({"error": str(e)}),
-                self.main_loop
-            )
+            self.main_loop.call_soon_threadsafe(self.response_queue.put_nowait, {"error": str(e)})
+    
+    async def send_response(self, response):
+        """Translate one recognition response (or error) into WebSocket messages"""
+        # Everything in one response arrived together; stamp it once
+        timestamp = datetime.now().isoformat()
+        
+        # Check for error
+        if isinstance(response, dict) and "error" in response:
+            await send_json_message(self.websocket, {
+                "type": "error",
+                "error": response["error"],
+                "timestamp": timestamp
+            })
+            return
+        
+        # Process speech recognition results
+        for result_index, result in enumerate(response.results):
+            for alternative in result.alternatives:
+                # Log transcript for debugging; interim hypotheses arrive several times a second,
+                # so keep them at debug with lazy formatting and only finals at info
+                if result.is_final:
+                    logger.info("Transcript: [FINAL] %s", alternative.transcript)
+                else:
+                    logger.debug("Transcript: [INTERIM] %s", alternative.transcript)
+        
+                # Interim hypotheses often repeat verbatim; the client already has this text.
+                # Tracked per result index since one response can carry several interim results
+                if result.is_final:
+                    self.last_interim_transcripts.clear()
+                elif alternative.transcript == self.last_interim_transcripts.get(result_index):
+                    continue
+                else:
+                    self.last_interim_transcripts[result_index] = alternative.transcript
+        
+                # Send transcript result (no speaker labeling needed)
+                result_data = {
+                    "type": "transcript",
+                    "transcript": alternative.transcript,
+                    "confidence": alternative.confidence if hasattr(alternative, 'confidence') else 1.0,
+                    "is_final": result.is_final,
+                    "timestamp": timestamp,
+                    "result_end_offset": result.result_end_offset.total_seconds() if hasattr(result, 'result_end_offset') else 0,
+                }
+        
+                # Add word-level timing for final results (WordInfo fields are always present on the proto)
+                if result.is_final:
+                    result_data["words"] = [
+                        {
+                            "word": word.word,
+                            "start_time": word.start_offset.total_seconds(),
+                            "end_time": word.end_offset.total_seconds(),
+                            "confidence": word.confidence,
+                            "speaker": word.speaker_label,
+                        }
+                        for word in alternative.words
+                    ]
+        
+                await send_json_message(self.websocket, result_data)
+        
+        # Handle voice activity events
+        if hasattr(response, 'speech_event_type'):
+            event_type = response.speech_event_type
+            if event_type == types.StreamingRecognizeResponse.SpeechEventType.SPEECH_ACTIVITY_BEGIN:
+                await send_json_message(self.websocket, {
+                    "type": "speech_event",
+                    "event": "speech_start",
+                    "timestamp": timestamp
+                })
+            elif event_type == types.StreamingRecognizeResponse.SpeechEventType.SPEECH_ACTIVITY_END:
+                await send_json_message(self.websocket, {
+                    "type": "speech_event",
+                    "event": "speech_end",
+                    "timestamp": timestamp
+                })
+    
+    @staticmethod
+    def is_interim_only(response) -> bool:
+        """True for a response carrying only interim results and no speech event"""
+        return (
+            not isinstance(response, dict)
+            and len(response.results) > 0
+            and not any(result.is_final for result in response.results)
+            and not response.speech_event_type
+        )
     
     async def process_responses(self):
         """Process responses from the queue and send to WebSocket"""
         try:
             while self.is_active:
                 try:
-                    # Get response from queue with timeout
-                    response = await asyncio.wait_for(
-                        self.response_queue.get(),
-                        timeout=0.1
-                    )
-                    
-                    # Check for error
-                    if isinstance(response, dict) and "error" in response:
-                        await self.websocket.send_json({
-                            "type": "error",
-                            "error": response["error"],
-                            "timestamp": datetime.now().isoformat()
-                        })
-                        continue
+                    # Wait for the next response; the websocket handler cancels this task on cleanup,
+                    # so there is no need to wake up on a timer to re-check is_active
+                    response = await self.response_queue.get()
                     
-                    # Process speech recognition results
-                    for result in response.results:
-                        for alternative in result.alternatives:
-                            # Log transcript for debugging
-                            logger.info(f"Transcript: {'[FINAL]' if result.is_final else '[INTERIM]'} {alternative.transcript}")
-                            
-                            # Send transcript result (no speaker labeling needed)
-                            result_data = {
-                                "type": "transcript",
-                                "transcript": alternative.transcript,
-                                "confidence": alternative.confidence if hasattr(alternative, 'confidence') else 1.0,
-                                "is_final": result.is_final,
-                                "timestamp": datetime.now().isoformat(),
-                                "result_end_offset": result.result_end_offset.total_seconds() if hasattr(result, 'result_end_offset') else 0,
-                            }
-                            
-                            # Add word-level timing for final results
-                            if result.is_final and hasattr(alternative, 'words'):
-                                result_data["words"] = [
-                                    {
-                                        "word": word.word,
-                                        "start_time": word.start_offset.total_seconds() if hasattr(word, 'start_offset') else 0,
-                                        "end_time": word.end_offset.total_seconds() if hasattr(word, 'end_offset') else 0,
-                                        "confidence": word.confidence if hasattr(word, 'confidence') else 1.0,
-                                        "speaker": word.speaker_label if hasattr(word, 'speaker_label') else 0,
-                                    }
-                                    for word in alternative.words
-                                ]
-                            
-                            await self.websocket.send_json(result_data)
+                    # Pick up anything else that queued while we were sending, so a burst of
+                    # interim hypotheses collapses to the newest one instead of one send each
+                    batch = [response]
+                    while True:
+                        try:
+                            batch.append(self.response_queue.get_nowait())
+                        except asyncio.QueueEmpty:
+                            break
                     
-                    # Handle voice activity events
-                    if hasattr(response, 'speech_event_type'):
-                        event_type = response.speech_event_type
-                        if event_type == types.StreamingRecognizeResponse.SpeechEventType.SPEECH_ACTIVITY_BEGIN:
-                            await self.websocket.send_json({
-                                "type": "speech_event",
-                                "event": "speech_start",
-                                "timestamp": datetime.now().isoformat()
-                            })
-                        elif event_type == types.StreamingRecognizeResponse.SpeechEventType.SPEECH_ACTIVITY_END:
-                            await self.websocket.send_json({
-                                "type": "speech_event",
-                                "event": "speech_end",
-                                "timestamp": datetime.now().isoformat()
-                            })
+                    for index, response in enumerate(batch):
+                        # A later result in the same batch supersedes this interim hypothesis
+                        if self.is_interim_only(response) and any(
+                            not isinstance(later, dict) and len(later.results) > 0
+                            for later in batch[index + 1:]
+                        ):
+                            continue
+                        await self.send_response(response)
                             
-                except asyncio.TimeoutError:
-                    continue
                 except Exception as e:
                     logger.error(f"Error processing response: {e}")
                     
@@ -335,12 +432,12 @@ async def websocket_transcribe(websocket: WebSocket):
         
         # Parse initialization and authenticate
         if init_message["type"] == "websocket.receive" and "text" in init_message:
-            init_data = json.loads(init_message["text"])
+            init_data = json_loads(init_message["text"])
             
             # --- Authentication Check ---
             token = init_data.get("token")
             if not token:
-                await websocket.send_json({
+                await send_json_message(websocket, {
                     "type": "error",
                     "error": "Authentication token required in initialization message",
                     "timestamp": datetime.now().isoformat()
@@ -348,9 +445,9 @@ async def websocket_transcribe(websocket: WebSocket):
                 await websocket.close(code=1008, reason="Authentication required")
                 return
             
-            decoded_token = verify_firebase_token(token)
+            decoded_token = await asyncio.to_thread(verify_firebase_token, token)
             if not decoded_token:
-                await websocket.send_json({
+                await send_json_message(websocket, {
                     "type": "error", 
                     "error": "Invalid or unauthorized token",
                     "timestamp": datetime.now().isoformat()
@@ -361,9 +458,14 @@ async def websocket_transcribe(websocket: WebSocket):
             user_email = decoded_token.get('email')
             session_id = init_data.get("session_id", datetime.now().strftime("%Y%m%d-%H%M%S"))
             logger.info(f"Authenticated session initialized: {session_id} for user: {user_email}")
-            logger.info(f"Client config: {init_data.get('config', {})}")
+            client_config = init_data.get('config', {})
+            logger.info(f"Client config: {client_config}")
+            # Interim results stay on unless a well-formed config explicitly disables them
+            if not isinstance(client_config, dict):
+                client_config = {}
+            interim_results = client_config.get('interim_results', True) is not False
         else:
-            await websocket.send_json({
+            await send_json_message(websocket, {
                 "type": "error",
                 "error": "Invalid initialization message format",
                 "timestamp": datetime.now().isoformat()
@@ -372,7 +474,7 @@ async def websocket_transcribe(websocket: WebSocket):
             return
         
         # Create transcription session
-        session = StreamingTranscriptionSession(session_id, websocket)
+        session = StreamingTranscriptionSession(session_id, websocket, interim_results)
         
         # Start streaming in background thread
         session.start_streaming()
@@ -381,7 +483,7 @@ async def websocket_transcribe(websocket: WebSocket):
         response_task = asyncio.create_task(session.process_responses())
         
         # Send ready signal
-        await websocket.send_json({
+        await send_json_message(websocket, {
             "type": "ready",
             "session_id": session_id,
             "timestamp": datetime.now().isoformat(),
@@ -390,7 +492,7 @@ async def websocket_transcribe(websocket: WebSocket):
                 "encoding": "WEBM_OPUS",
                 "chunk_duration_ms": 100,
                 "features": {
-                    "interim_results": True,
+                    "interim_results": interim_results,
                 }
             }
         })
@@ -411,7 +513,7 @@ async def websocket_transcribe(websocket: WebSocket):
                         session.add_audio(message["bytes"])
                     elif "text" in message:
                         # Handle control messages
-                        data = json.loads(message["text"])
+                        data = json_loads(message["text"])
                         if data.get("type") == "stop":
                             logger.info("Received stop signal")
                             break
@@ -430,15 +532,15 @@ async def websocket_transcribe(websocket: WebSocket):
     except Exception as e:
         logger.error(f"WebSocket error: {e}")
         if websocket.client_state.value == 1:  # OPEN
-            await websocket.send_json({
+            await send_json_message(websocket, {
                 "type": "error",
                 "error": str(e),
                 "timestamp": datetime.now().isoformat()
             })
     finally:
-        # Clean up
+        # Clean up (stop() joins the streaming thread, so run it off the event loop)
         if session:
-            session.stop()
+            await asyncio.to_thread(session.stop)
         if response_task:
             response_task.cancel()
             try:
@@ -467,7 +569,7 @@ async def health(current_user: dict = Depends(get_current_user)):
     try:
         # Test Speech API connectivity
         parent = f"projects/{project_id}/locations/{location}"
-        recognizers = speech_client.list_recognizers(parent=parent)
+        recognizers = await asyncio.to_thread(speech_client.list_recognizers, parent=parent)
         api_status = "connected"
     except Exception as e:
         api_status = f"error: {str(e)}"
@@ -497,4 +599,6 @@ async def test_auth(current_user: dict = Depends(get_current_user)):
 if __name__ == "__main__":
     import uvicorn
     port = int(os.environ.get("PORT", 8080))
-    uvicorn.run(app, host="0.0.0.0", port=port)
+    # "auto" picks uvloop when installed; set UVICORN_LOOP=asyncio or uvloop to force one
+    loop = os.environ.get("UVICORN_LOOP", "auto")
+    uvicorn.run(app, host="0.0.0.0", port=port, loop=loop, ws_per_message_deflate=True)
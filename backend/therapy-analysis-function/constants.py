@@ -12,8 +12,34 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+from dataclasses import dataclass
+
 MODEL_NAME = "gemini-2.5-flash"
 
+# Upper bounds on Gemini request time (milliseconds) so a stalled call cannot hold the function open
+REALTIME_TIMEOUT_MS = 30_000
+ANALYSIS_TIMEOUT_MS = 180_000
+
+# Maximum number of Gemini responses kept in the per-instance response cache
+RESPONSE_CACHE_MAX_ENTRIES = 256
+
+# Maximum number of verified Firebase ID tokens remembered per instance
+TOKEN_CACHE_MAX_ENTRIES = 128
+
+# Maximum number of segments accepted in one batch request; one wave of workers, so a
+# batch takes about as long as its slowest segment
+BATCH_MAX_SEGMENTS = 4
+
+# Maximum number of batched segments analyzed concurrently
+BATCH_MAX_WORKERS = 4
+
+# Overall time budget for a batch request (seconds), kept under the function's request timeout;
+# segments still running when it expires are reported as errors
+BATCH_DEADLINE_SECONDS = 240
+
+# Largest request body accepted after decompressing a gzip-encoded request
+MAX_DECOMPRESSED_BODY_BYTES = 10 * 1024 * 1024
+
 # Phrases that trigger non-strict analysis
 TRIGGER_PHRASES = [
     "something else came up",
@@ -23,10 +49,15 @@ TRIGGER_PHRASES = [
 ]
 
 # Therapy phase definitions
+@dataclass(frozen=True, slots=True)
+class TherapyPhase:
+    duration_minutes: int
+    focus: str
+
 THERAPY_PHASES = {
-    "beginning": {"duration_minutes": 10, "focus": "rapport building, agenda setting"},
-    "middle": {"duration_minutes": 30, "focus": "core therapeutic work"},
-    "end": {"duration_minutes": 10, "focus": "summary, homework, closure"}
+    "beginning": TherapyPhase(duration_minutes=10, focus="rapport building, agenda setting"),
+    "middle": TherapyPhase(duration_minutes=30, focus="core therapeutic work"),
+    "end": TherapyPhase(duration_minutes=10, focus="summary, homework, closure")
 }
 
 # Prompts
@@ -143,6 +174,17 @@ If an guidance is needed, prioritize actionable guidance and return only the MOS
 IMPORTANT NOTE:
 Always refer to the patient as 'patient'"""
 
+# Previous alert context substituted into the realtime prompts' PREVIOUS GUIDANCE section
+NO_PREVIOUS_ALERT_CONTEXT = "No previous alert to consider."
+
+PREVIOUS_ALERT_CONTEXT_TEMPLATE = """
+Title: {title}
+Category: {category}
+Message: {message}
+Recommendation: {recommendation}
+Timing: {timing}
+"""
+
 ## NOTE: Alternate pathways has been removed
 COMPREHENSIVE_ANALYSIS_PROMPT = """<thinking>
 Analyze this therapy session segment step by step:
@@ -21,11 +21,19 @@ import os
 import json
 import logging
 import re
+import copy
+import hashlib
+import zlib
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed, TimeoutError as FuturesTimeoutError
 from typing import List, Dict, Tuple, Optional, Any
 from datetime import datetime, timedelta
 import firebase_admin
 from firebase_admin import auth, credentials
 from dotenv import load_dotenv
+import orjson
 from . import constants
 
 # Load environment variables
@@ -47,6 +55,26 @@ except Exception as e:
 ALLOWED_DOMAINS = set(os.environ.get('AUTH_ALLOWED_DOMAINS', '').split(',')) if os.environ.get('AUTH_ALLOWED_DOMAINS') else set()
 ALLOWED_EMAILS = set(os.environ.get('AUTH_ALLOWED_EMAILS', '').split(',')) if os.environ.get('AUTH_ALLOWED_EMAILS') else set()
 
+def json_loads(data):
+    """Decode JSON from str or bytes"""
+    return orjson.loads(data)
+
+def json_dumps(obj) -> str:
+    """Encode an object as compact JSON text"""
+    return orjson.dumps(obj).decode('utf-8')
+
+def ndjson_line(obj) -> bytes:
+    """Encode an object as one newline-terminated NDJSON line, ready to stream as bytes"""
+    return orjson.dumps(obj, option=orjson.OPT_APPEND_NEWLINE)
+
+# Patterns for pulling a JSON object out of model output, compiled once at load time
+JSON_PATTERNS = (
+    # Find JSON that starts with { and ends with } (greedy)
+    re.compile(r'\{.*\}', re.DOTALL | re.IGNORECASE),
+    # Find JSON in code blocks
+    re.compile(r'```(?:json)?\s*(\{.*\})\s*```', re.DOTALL | re.IGNORECASE),
+)
+
 def extract_json_from_text(text: str) -> Optional[Dict[str, Any]]:
     """
     Simplified JSON extraction from text that may contain extra content.
@@ -58,27 +86,20 @@ def extract_json_from_text(text: str) -> Optional[Dict[str, Any]]:
     
     # Strategy 1: Try to parse the entire text as JSON first
     try:
-        return json.loads(text.strip())
+        return json_loads(text.strip())
     except json.JSONDecodeError:
         logging.debug("Failed to parse entire text as JSON, trying regex extraction")
     
     # Strategy 2: Look for JSON objects using basic regex patterns
-    json_patterns = [
-        # Find JSON that starts with { and ends with } (greedy)
-        r'\{.*\}',
-        # Find JSON in code blocks
-        r'```(?:json)?\s*(\{.*\})\s*```'
-    ]
-    
-    for i, pattern in enumerate(json_patterns):
+    for i, pattern in enumerate(JSON_PATTERNS):
         try:
-            matches = re.finditer(pattern, text, re.DOTALL | re.IGNORECASE)
+            matches = pattern.finditer(text)
             for match in matches:
                 # For patterns with groups, use the group; otherwise use the full match
                 json_text = match.group(1) if match.groups() else match.group(0)
                 
                 try:
-                    parsed = json.loads(json_text.strip())
+                    parsed = json_loads(json_text.strip())
                     logging.info(f"Successfully extracted JSON using pattern {i+1}")
                     return parsed
                 except json.JSONDecodeError:
@@ -92,6 +113,22 @@ def extract_json_from_text(text: str) -> Optional[Dict[str, Any]]:
     logging.info(text)
     return None
 
+def parse_request_json(req) -> Optional[Dict[str, Any]]:
+    """Parse the JSON request body, accepting gzip-compressed bodies from clients that send large transcripts"""
+    if req.headers.get('Content-Encoding', '').lower() != 'gzip':
+        return req.get_json(silent=True)
+    
+    try:
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)  # gzip container
+        body = decompressor.decompress(req.get_data(), constants.MAX_DECOMPRESSED_BODY_BYTES)
+        if decompressor.unconsumed_tail:
+            logging.warning("Gzip request body exceeds decompressed size limit")
+            return None
+        return json_loads(body)
+    except (zlib.error, ValueError) as e:
+        logging.warning(f"Failed to decode gzip request body: {e}")
+        return None
+
 def is_email_authorized(email: str) -> bool:
     """Check if email is authorized based on domain or explicit allowlist"""
     if not email:
@@ -105,8 +142,37 @@ def is_email_authorized(email: str) -> bool:
     email_domain = email.split('@')[-1] if '@' in email else ''
     return email_domain in ALLOWED_DOMAINS
 
+# The frontend sends the same ID token with every segment request, so remember
+# authorized tokens until they expire instead of re-verifying each time
+_token_cache: "OrderedDict[str, Dict]" = OrderedDict()
+_token_cache_lock = threading.Lock()
+
+def get_cached_token(token: str) -> Optional[Dict]:
+    """Return the decoded claims for a previously verified, unexpired token"""
+    with _token_cache_lock:
+        decoded_token = _token_cache.get(token)
+        if decoded_token is None:
+            return None
+        if decoded_token.get('exp', 0) <= time.time():
+            del _token_cache[token]
+            return None
+        _token_cache.move_to_end(token)
+        return decoded_token
+
+def store_cached_token(token: str, decoded_token: Dict) -> None:
+    """Remember an authorized token, evicting the least recently used entry when full"""
+    with _token_cache_lock:
+        _token_cache[token] = decoded_token
+        _token_cache.move_to_end(token)
+        while len(_token_cache) > constants.TOKEN_CACHE_MAX_ENTRIES:
+            _token_cache.popitem(last=False)
+
 def verify_firebase_token(token: str) -> Optional[Dict]:
     """Verify Firebase ID token and return decoded claims"""
+    cached_token = get_cached_token(token)
+    if cached_token is not None:
+        return cached_token
+    
     try:
         decoded_token = auth.verify_id_token(token)
         email = decoded_token.get('email')
@@ -116,11 +182,39 @@ def verify_firebase_token(token: str) -> Optional[Dict]:
             return None
             
         logging.info(f"Authorized user authenticated: {email}")
+        store_cached_token(token, decoded_token)
         return decoded_token
     except Exception as e:
         logging.error(f"Token verification failed: {e}")
         return None
 
+# --- In-process Response Cache ---
+# Warm function instances serve many requests, so byte-identical prompts can reuse an
+# earlier Gemini response instead of paying for another model call.
+_response_cache: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+_response_cache_lock = threading.Lock()
+
+def response_cache_key(*parts: str) -> str:
+    """Build a compact cache key from the exact prompt parts"""
+    return hashlib.blake2b('\x1f'.join(parts).encode('utf-8'), digest_size=16).hexdigest()
+
+def get_cached_response(key: str) -> Optional[Dict[str, Any]]:
+    """Return a copy of a cached response, or None on a miss"""
+    with _response_cache_lock:
+        cached = _response_cache.get(key)
+        if cached is None:
+            return None
+        _response_cache.move_to_end(key)
+    return copy.deepcopy(cached)
+
+def store_cached_response(key: str, response: Dict[str, Any]) -> None:
+    """Store a response, evicting the least recently used entry when full"""
+    with _response_cache_lock:
+        _response_cache[key] = copy.deepcopy(response)
+        _response_cache.move_to_end(key)
+        while len(_response_cache) > constants.RESPONSE_CACHE_MAX_ENTRIES:
+            _response_cache.popitem(last=False)
+
 
 # --- Initialize Google GenAI ---
 try:
@@ -157,6 +251,47 @@ TRANSCRIPT_RAG_TOOL = types.Tool(
     )
 )
 
+# CORS headers are identical for every response; build them once
+CORS_HEADERS = {
+    'Access-Control-Allow-Origin': '*',
+    'Access-Control-Allow-Methods': 'GET, POST',
+    'Access-Control-Allow-Headers': 'Content-Type, Content-Encoding, Authorization'
+}
+CORS_PREFLIGHT_HEADERS = {**CORS_HEADERS, 'Access-Control-Max-Age': '3600'}
+
+# Safety filters are disabled for clinical content; shared by every Gemini request
+SAFETY_SETTINGS = [
+    types.SafetySetting(
+        category="HARM_CATEGORY_HARASSMENT",
+        threshold="OFF"
+    ),
+    types.SafetySetting(
+        category="HARM_CATEGORY_HATE_SPEECH",
+        threshold="OFF"
+    ),
+    types.SafetySetting(
+        category="HARM_CATEGORY_SEXUALLY_EXPLICIT",
+        threshold="OFF"
+    ),
+    types.SafetySetting(
+        category="HARM_CATEGORY_DANGEROUS_CONTENT",
+        threshold="OFF"
+    )
+]
+
+# FAST configuration for real-time guidance; fully static, so built once at load time
+REALTIME_CONFIG = types.GenerateContentConfig(
+    temperature=0.0,  # Deterministic for speed
+    max_output_tokens=300,  # Minimal output
+    safety_settings=SAFETY_SETTINGS,
+    tools=[],  # No RAG for speed
+    thinking_config=types.ThinkingConfig(
+        thinking_budget=0,  # Zero thinking for fastest response
+        include_thoughts=False
+    ),
+    http_options=types.HttpOptions(timeout=constants.REALTIME_TIMEOUT_MS),
+)
+
 @functions_framework.http
 def therapy_analysis(request):
     """
@@ -164,21 +299,11 @@ def therapy_analysis(request):
     Requires Firebase authentication.
     """
     # --- CORS Handling ---
-    logging.warning(request.method)
+    logging.debug(f"Received {request.method} request")
     if request.method == 'OPTIONS':
-        headers = {
-            'Access-Control-Allow-Origin': '*',
-            'Access-Control-Allow-Methods': 'GET, POST',
-            'Access-Control-Allow-Headers': 'Content-Type, Authorization',
-            'Access-Control-Max-Age': '3600'
-        }
-        return ('', 204, headers)
+        return ('', 204, CORS_PREFLIGHT_HEADERS)
 
-    headers = {
-        'Access-Control-Allow-Origin': '*',
-        'Access-Control-Allow-Methods': 'GET, POST',
-        'Access-Control-Allow-Headers': 'Content-Type, Authorization'
-    }
+    headers = CORS_HEADERS
 
     if request.method != 'POST':
         logging.warning(f"Received non-POST request: {request.method}")
@@ -195,7 +320,7 @@ def therapy_analysis(request):
         return (jsonify({'error': 'Invalid or unauthorized token'}), 401, headers)
 
     try:
-        request_json = request.get_json(silent=True)
+        request_json = parse_request_json(request)
 
         if not request_json:
             logging.warning("Request JSON missing.")
@@ -205,12 +330,14 @@ def therapy_analysis(request):
         
         if action == 'analyze_segment':
             return handle_segment_analysis(request_json, headers)
+        elif action == 'analyze_segments_batch':
+            return handle_segments_batch_analysis(request_json, headers)
         elif action == 'pathway_guidance':
             return handle_pathway_guidance(request_json, headers)
         elif action == 'session_summary':
             return handle_session_summary(request_json, headers)
         else:
-            return (jsonify({'error': 'Invalid action. Use "analyze_segment", "pathway_guidance", or "session_summary"'}), 400, headers)
+            return (jsonify({'error': 'Invalid action. Use "analyze_segment", "analyze_segments_batch", "pathway_guidance", or "session_summary"'}), 400, headers)
 
     except Exception as e:
         logging.exception(f"An unexpected error occurred: {str(e)}")
@@ -226,7 +353,7 @@ def handle_segment_analysis(request_json, headers):
         previous_alert = request_json.get('previous_alert', None)  # Previous alert for deduplication
         
         logging.info(f"Segment analysis request - duration: {session_duration} minutes, segments: {len(transcript_segment)}, realtime: {is_realtime}, has_previous_alert: {previous_alert is not None}")
-        logging.info(f"Transcript segment: {transcript_segment[-1]}")
+        logging.debug(f"Transcript segment: {transcript_segment[-1]}")
         
         if not transcript_segment:
             return (jsonify({'error': 'Missing transcript_segment'}), 400, headers)
@@ -242,17 +369,8 @@ def handle_segment_analysis(request_json, headers):
         logging.info(f"[TIMING] Analysis started at: {analysis_start.isoformat()}")
         
         # Format previous alert context for deduplication
-        if previous_alert and is_realtime:
-            # Only use previous alert context for real-time analysis (where we generate alerts)
-            previous_alert_context = f"""
-Title: {previous_alert.get('title', 'N/A')}
-Category: {previous_alert.get('category', 'N/A')}
-Message: {previous_alert.get('message', 'N/A')}
-Recommendation: {previous_alert.get('recommendation', 'N/A')}
-Timing: {previous_alert.get('timing', 'N/A')}
-"""
-        else:
-            previous_alert_context = "No previous alert to consider."
+        # Only use previous alert context for real-time analysis (where we generate alerts)
+        previous_alert_context = format_previous_alert_context(previous_alert if is_realtime else None)
 
         # Choose analysis mode based on is_realtime flag
         if is_realtime:
@@ -262,15 +380,7 @@ Timing: {previous_alert.get('timing', 'N/A')}
             )
         else:
             # COMPREHENSIVE PATH: Full analysis with RAG
-            analysis_prompt = constants.COMPREHENSIVE_ANALYSIS_PROMPT.format(
-                phase=phase,
-                phase_focus=constants.THERAPY_PHASES[phase]['focus'],
-                session_duration=session_duration,
-                session_type=session_context.get('session_type', 'General Therapy'),
-                primary_concern=session_context.get('primary_concern', 'Not specified'),
-                current_approach=session_context.get('current_approach', 'Not specified'),
-                transcript_text=transcript_text
-            )
+            analysis_prompt = build_comprehensive_prompt(phase, session_duration, session_context, transcript_text)
             
             return handle_comprehensive_analysis(analysis_prompt, phase, headers)
         
@@ -278,6 +388,9 @@ Timing: {previous_alert.get('timing', 'N/A')}
         logging.exception(f"Error in handle_segment_analysis: {str(e)}")
         return (jsonify({'error': f'Segment analysis failed: {str(e)}'}), 500, headers)
 
+# Trigger phrases are matched case-insensitively; lowercase them once rather than per request
+TRIGGER_PHRASES_LOWER = tuple(phrase.lower() for phrase in constants.TRIGGER_PHRASES)
+
 def check_for_trigger_phrases(transcript_segment):
     """Check if the most recent transcript item contains any trigger phrases"""
     if not transcript_segment:
@@ -288,286 +401,331 @@ def check_for_trigger_phrases(transcript_segment):
     latest_text = latest_item.get('text', '').lower()
     
     # Check against all trigger phrases
-    for phrase in constants.TRIGGER_PHRASES:
-        if phrase.lower() in latest_text:
+    for phrase in TRIGGER_PHRASES_LOWER:
+        if phrase in latest_text:
             logging.info(f"Trigger phrase '{phrase}' found in latest transcript item")
             return True
     
     return False
 
-def handle_realtime_analysis_with_retry(transcript_segment, transcript_text, previous_alert_context, phase, headers):
-    """Handle realtime analysis with retry mechanism using different prompts"""
-    
-    def try_analysis_with_prompt(prompt_template, prompt_name):
-        """Helper function to try analysis with a specific prompt"""
-        try:
-            analysis_prompt = prompt_template.format(
-                transcript_text=transcript_text,
-                previous_alert_context=previous_alert_context
-            )
-            
-            contents = [types.Content(
-                role="user",
-                parts=[types.Part(text=analysis_prompt)]
-            )]
-            
-            # FAST configuration for real-time guidance
-            config = types.GenerateContentConfig(
-                temperature=0.0,  # Deterministic for speed
-                max_output_tokens=300,  # Minimal output
-                safety_settings=[
-                    types.SafetySetting(
-                        category="HARM_CATEGORY_HARASSMENT",
-                        threshold="OFF"
-                    ),
-                    types.SafetySetting(
-                        category="HARM_CATEGORY_HATE_SPEECH",
-                        threshold="OFF"
-                    ),
-                    types.SafetySetting(
-                        category="HARM_CATEGORY_SEXUALLY_EXPLICIT",
-                        threshold="OFF"
-                    ),
-                    types.SafetySetting(
-                        category="HARM_CATEGORY_DANGEROUS_CONTENT",
-                        threshold="OFF"
-                    )
-                ],
-                tools=[],  # No RAG for speed
-                thinking_config=types.ThinkingConfig(
-                    thinking_budget=0,  # Zero thinking for fastest response
-                    include_thoughts=False
-                ),
-            )
-            
-            logging.info(f"[TIMING] Trying realtime analysis with {prompt_name}")
-            
-            # Collect response text
-            accumulated_text = ""
-            for chunk in client.models.generate_content_stream(
-                model=constants.MODEL_NAME,
-                contents=contents,
-                config=config
-            ):
-                if chunk.candidates and chunk.candidates[0].content and chunk.candidates[0].content.parts:
-                    for part in chunk.candidates[0].content.parts:
-                        if hasattr(part, 'text') and part.text:
-                            accumulated_text += part.text
-            
-            logging.info(f"Response received from {prompt_name} - length: {len(accumulated_text)} characters")
-            
-            # Try to parse the JSON response
-            parsed = extract_json_from_text(accumulated_text)
-            
-            if parsed is not None:
-                logging.info(f"Successfully parsed JSON from {prompt_name}")
-                return parsed, accumulated_text
-            else:
-                # Log first 200 characters of response on parsing failure
-                response_preview = accumulated_text[:200] if accumulated_text else "No response received"
-                logging.error(f"JSON parsing failed for {prompt_name}. First 200 characters of response: {response_preview} - {str(parsed)}")
-                logging.warning(f"Full response from {prompt_name}: {accumulated_text}")
-                return None, accumulated_text
-                
-        except Exception as e:
-            logging.error(f"Error during {prompt_name} analysis: {str(e)}")
-            return None, str(e)
-    
-    def generate():
-        """Generator function for streaming response with retry logic"""
-        try:
-            # Check for trigger phrases to determine prompt selection
-            has_trigger_phrase = check_for_trigger_phrases(transcript_segment)
+def try_realtime_analysis_with_prompt(prompt_template, prompt_name, transcript_text, previous_alert_context):
+    """Try realtime analysis with a specific prompt, returning (parsed_result, response_text)"""
+    try:
+        analysis_prompt = prompt_template.format(
+            transcript_text=transcript_text,
+            previous_alert_context=previous_alert_context
+        )
+        
+        # Realtime analysis is deterministic (temperature 0), so an identical trailing
+        # transcript and previous alert can reuse the earlier result
+        cache_key = response_cache_key('realtime_analysis', analysis_prompt)
+        cached_response = get_cached_response(cache_key)
+        if cached_response is not None:
+            logging.info(f"Realtime analysis with {prompt_name} served from response cache")
+            return cached_response, ""
+        
+        contents = [types.Content(
+            role="user",
+            parts=[types.Part(text=analysis_prompt)]
+        )]
+        
+        logging.info(f"[TIMING] Trying realtime analysis with {prompt_name}")
+        
+        # Collect response text parts and join once at the end
+        text_parts = []
+        for chunk in client.models.generate_content_stream(
+            model=constants.MODEL_NAME,
+            contents=contents,
+            config=REALTIME_CONFIG
+        ):
+            if chunk.candidates and chunk.candidates[0].content and chunk.candidates[0].content.parts:
+                for part in chunk.candidates[0].content.parts:
+                    if hasattr(part, 'text') and part.text:
+                        text_parts.append(part.text)
+        accumulated_text = "".join(text_parts)
+        
+        logging.info(f"Response received from {prompt_name} - length: {len(accumulated_text)} characters")
+        
+        # Try to parse the JSON response
+        parsed = extract_json_from_text(accumulated_text)
+        
+        if parsed is not None:
+            logging.info(f"Successfully parsed JSON from {prompt_name}")
+            store_cached_response(cache_key, parsed)
+            return parsed, accumulated_text
+        else:
+            # Log first 200 characters of response on parsing failure
+            response_preview = accumulated_text[:200] if accumulated_text else "No response received"
+            logging.error(f"JSON parsing failed for {prompt_name}. First 200 characters of response: {response_preview} - {str(parsed)}")
+            logging.debug(f"Full response from {prompt_name}: {accumulated_text}")
+            return None, accumulated_text
             
-            if has_trigger_phrase:
-                # Trigger phrase found - use non-strict prompt first
-                first_prompt = constants.REALTIME_ANALYSIS_PROMPT
-                first_prompt_name = "REALTIME_ANALYSIS_PROMPT"
-                fallback_prompt = constants.REALTIME_ANALYSIS_PROMPT_STRICT
-                fallback_prompt_name = "REALTIME_ANALYSIS_PROMPT_STRICT"
-                logging.info("Trigger phrase detected - using non-strict prompt first")
-            else:
-                # No trigger phrase - use strict prompt first (original behavior)
-                first_prompt = constants.REALTIME_ANALYSIS_PROMPT_STRICT
-                first_prompt_name = "REALTIME_ANALYSIS_PROMPT_STRICT"
-                fallback_prompt = constants.REALTIME_ANALYSIS_PROMPT
-                fallback_prompt_name = "REALTIME_ANALYSIS_PROMPT"
-                logging.info("No trigger phrase detected - using strict prompt first")
+    except Exception as e:
+        logging.error(f"Error during {prompt_name} analysis: {str(e)}")
+        return None, str(e)
+
+# Realtime prompt variants as (label, prompt name, template); tried in order, the second as a fallback
+REALTIME_PROMPT_ATTEMPTS_STRICT_FIRST = (
+    ('strict', "REALTIME_ANALYSIS_PROMPT_STRICT", constants.REALTIME_ANALYSIS_PROMPT_STRICT),
+    ('non-strict', "REALTIME_ANALYSIS_PROMPT", constants.REALTIME_ANALYSIS_PROMPT),
+)
+REALTIME_PROMPT_ATTEMPTS_NON_STRICT_FIRST = tuple(reversed(REALTIME_PROMPT_ATTEMPTS_STRICT_FIRST))
+
+def run_realtime_analysis(transcript_segment, transcript_text, previous_alert_context, phase) -> Dict[str, Any]:
+    """Run realtime analysis with a fallback prompt and return the result (or error) dict"""
+    try:
+        # Check for trigger phrases to determine prompt selection
+        has_trigger_phrase = check_for_trigger_phrases(transcript_segment)
+        
+        if has_trigger_phrase:
+            # Trigger phrase found - use non-strict prompt first
+            attempts = REALTIME_PROMPT_ATTEMPTS_NON_STRICT_FIRST
+            logging.info("Trigger phrase detected - using non-strict prompt first")
+        else:
+            # No trigger phrase - use strict prompt first (original behavior)
+            attempts = REALTIME_PROMPT_ATTEMPTS_STRICT_FIRST
+            logging.info("No trigger phrase detected - using strict prompt first")
+        
+        response_text = None
+        for attempt_index, (prompt_label, prompt_name, prompt_template) in enumerate(attempts):
+            if attempt_index > 0:
+                logging.info(f"{attempts[attempt_index - 1][1]} failed, retrying with fallback {prompt_name}")
             
-            # First attempt with selected prompt
-            parsed_result, response_text = try_analysis_with_prompt(
-                first_prompt, 
-                first_prompt_name
+            parsed_result, response_text = try_realtime_analysis_with_prompt(
+                prompt_template,
+                prompt_name,
+                transcript_text,
+                previous_alert_context
             )
             
             if parsed_result is not None:
-                # Success with first prompt
                 parsed_result['timestamp'] = datetime.now().isoformat()
                 parsed_result['session_phase'] = phase
                 parsed_result['analysis_type'] = 'realtime'
-                parsed_result['prompt_used'] = 'non-strict' if has_trigger_phrase else 'strict'
+                parsed_result['prompt_used'] = prompt_label
                 parsed_result['trigger_phrase_detected'] = has_trigger_phrase
-                
-                yield json.dumps(parsed_result) + "\n"
-                return
-            
-            # First attempt failed, try with fallback prompt
-            logging.info(f"{first_prompt_name} failed, retrying with fallback {fallback_prompt_name}")
-            
-            parsed_result, response_text = try_analysis_with_prompt(
-                fallback_prompt, 
-                fallback_prompt_name
+                if attempt_index > 0:
+                    parsed_result['used_fallback'] = True
+                return parsed_result
+        
+        # All attempts failed
+        logging.error("Both prompts failed to produce valid JSON")
+        return {
+            'error': 'Failed to parse analysis response after retry - no valid JSON found',
+            'raw_response': response_text[:200] if response_text else 'No response received',
+            'trigger_phrase_detected': has_trigger_phrase,
+            'attempts': [prompt_name for _, prompt_name, _ in attempts]
+        }
+        
+    except Exception as e:
+        logging.exception(f"Error during realtime analysis with retry: {str(e)}")
+        return {'error': f'Realtime analysis failed: {str(e)}'}
+
+def handle_realtime_analysis_with_retry(transcript_segment, transcript_text, previous_alert_context, phase, headers):
+    """Handle realtime analysis with retry mechanism using different prompts"""
+    
+    def generate():
+        """Generator function for streaming response with retry logic"""
+        yield ndjson_line(run_realtime_analysis(
+            transcript_segment, transcript_text, previous_alert_context, phase
+        ))
+    
+    return Response(generate(), mimetype='text/plain', headers=headers)
+
+def is_valid_batch_segment(segment) -> bool:
+    """Check that a batched segment has the field types the analysis helpers expect"""
+    if not isinstance(segment, dict):
+        return False
+    transcript_segment = segment.get('transcript_segment')
+    if not transcript_segment or not isinstance(transcript_segment, list):
+        return False
+    if not all(isinstance(entry, dict) and isinstance(entry.get('text'), str) for entry in transcript_segment):
+        return False
+    previous_alert = segment.get('previous_alert')
+    if previous_alert is not None and not isinstance(previous_alert, dict):
+        return False
+    session_duration = segment.get('session_duration_minutes', 0)
+    return isinstance(session_duration, (int, float)) and not isinstance(session_duration, bool)
+
+def handle_segments_batch_analysis(request_json, headers):
+    """Handle analysis of several transcript segments in a single streaming request"""
+    segments = request_json.get('segments', [])
+    session_context = request_json.get('session_context', {})  # Shared by every segment
+    
+    if not segments or not isinstance(segments, list):
+        return (jsonify({'error': 'Missing segments'}), 400, headers)
+    
+    logging.info(f"Batch segment analysis request - segments: {len(segments)}")
+    
+    if len(segments) > constants.BATCH_MAX_SEGMENTS:
+        return (jsonify({'error': f'Too many segments (max {constants.BATCH_MAX_SEGMENTS})'}), 400, headers)
+    if not isinstance(session_context, dict):
+        return (jsonify({'error': 'session_context must be an object'}), 400, headers)
+    for segment in segments:
+        if not is_valid_batch_segment(segment):
+            return (jsonify({'error': 'Each segment requires a transcript_segment list of entries and a numeric session_duration_minutes'}), 400, headers)
+    
+    def analyze_segment(segment) -> Dict[str, Any]:
+        """Run realtime (default) or comprehensive analysis for one batched segment"""
+        transcript_segment = segment['transcript_segment']
+        session_duration = segment.get('session_duration_minutes', 0)
+        phase = determine_therapy_phase(session_duration)
+        transcript_text = format_transcript_segment(transcript_segment)
+        
+        if segment.get('is_realtime', True):
+            return run_realtime_analysis(
+                transcript_segment,
+                transcript_text,
+                format_previous_alert_context(segment.get('previous_alert')),
+                phase
             )
-            
-            if parsed_result is not None:
-                # Success with fallback prompt
-                parsed_result['timestamp'] = datetime.now().isoformat()
-                parsed_result['session_phase'] = phase
-                parsed_result['analysis_type'] = 'realtime'
-                parsed_result['prompt_used'] = 'strict' if has_trigger_phrase else 'non-strict'
-                parsed_result['trigger_phrase_detected'] = has_trigger_phrase
-                parsed_result['used_fallback'] = True
-                
-                yield json.dumps(parsed_result) + "\n"
-                return
-            
-            # Both attempts failed
-            logging.error("Both prompts failed to produce valid JSON")
-            yield json.dumps({
-                'error': 'Failed to parse analysis response after retry - no valid JSON found',
-                'raw_response': response_text[:200] if response_text else 'No response received',
-                'trigger_phrase_detected': has_trigger_phrase,
-                'attempts': [first_prompt_name, fallback_prompt_name]
-            }) + "\n"
-            
+        return run_comprehensive_analysis(
+            build_comprehensive_prompt(phase, session_duration, session_context, transcript_text),
+            phase
+        )
+    
+    def analyze_indexed_segment(index, segment) -> Dict[str, Any]:
+        """Analyze one segment and tag the result with its position in the batch"""
+        # The response has already started streaming, so a failure must become an error line
+        # for this segment rather than an exception that truncates the stream
+        try:
+            result = analyze_segment(segment)
         except Exception as e:
-            logging.exception(f"Error during realtime analysis with retry: {str(e)}")
-            yield json.dumps({'error': f'Realtime analysis failed: {str(e)}'}) + "\n"
+            logging.exception(f"Error analyzing batch segment {index}: {str(e)}")
+            result = {'error': f'Segment analysis failed: {str(e)}'}
+        result['segment_index'] = index
+        return result
+    
+    def generate():
+        """Generator function streaming one result line per segment as each Gemini call finishes"""
+        # Segments are independent, so their model calls run concurrently; lines arrive in
+        # completion order and clients reassemble them by segment_index
+        max_workers = min(len(segments), constants.BATCH_MAX_WORKERS)
+        executor = ThreadPoolExecutor(max_workers=max_workers)
+        futures = {
+            executor.submit(analyze_indexed_segment, index, segment): index
+            for index, segment in enumerate(segments)
+        }
+        pending = set(futures)
+        try:
+            for future in as_completed(futures, timeout=constants.BATCH_DEADLINE_SECONDS):
+                pending.discard(future)
+                yield ndjson_line(future.result())
+        except FuturesTimeoutError:
+            logging.error(f"Batch deadline of {constants.BATCH_DEADLINE_SECONDS}s reached with {len(pending)} segments unfinished")
+            for future in sorted(pending, key=futures.get):
+                yield ndjson_line({
+                    'error': 'Segment analysis did not finish within the batch deadline',
+                    'segment_index': futures[future]
+                })
+        finally:
+            # Do not wait on calls that overran the deadline; they end at their own request timeout
+            executor.shutdown(wait=False, cancel_futures=True)
     
     return Response(generate(), mimetype='text/plain', headers=headers)
 
-def handle_comprehensive_analysis(analysis_prompt, phase, headers):
-    """Handle comprehensive analysis (non-realtime)"""
+def build_comprehensive_prompt(phase, session_duration, session_context, transcript_text) -> str:
+    """Fill the comprehensive analysis prompt for a transcript segment"""
+    return constants.COMPREHENSIVE_ANALYSIS_PROMPT.format(
+        phase=phase,
+        phase_focus=constants.THERAPY_PHASES[phase].focus,
+        session_duration=session_duration,
+        session_type=session_context.get('session_type', 'General Therapy'),
+        primary_concern=session_context.get('primary_concern', 'Not specified'),
+        current_approach=session_context.get('current_approach', 'Not specified'),
+        transcript_text=transcript_text
+    )
+
+def run_comprehensive_analysis(analysis_prompt, phase) -> Dict[str, Any]:
+    """Run comprehensive analysis with RAG and return the result (or error) dict"""
+    chunk_index = 0
+    text_parts = []
+    grounding_chunks = []
     
-    def generate():
-        """Generator function for comprehensive analysis streaming"""
-        chunk_index = 0
-        accumulated_text = ""
-        grounding_chunks = []
+    try:
+        contents = [types.Content(
+            role="user",
+            parts=[types.Part(text=analysis_prompt)]
+        )]
         
-        try:
-            contents = [types.Content(
-                role="user",
-                parts=[types.Part(text=analysis_prompt)]
-            )]
-            
-            # COMPREHENSIVE configuration for full analysis
-            thinking_budget = 8192  # Moderate complexity for balanced analysis
-            
-            # Determine if we need more complex reasoning
-            if "suicide" in analysis_prompt.lower() or "self-harm" in analysis_prompt.lower():
-                thinking_budget = 24576  # Maximum for critical situations
-            
-            config = types.GenerateContentConfig(
-                temperature=0.3,
-                max_output_tokens=4096,
-                safety_settings=[
-                    types.SafetySetting(
-                        category="HARM_CATEGORY_HARASSMENT",
-                        threshold="OFF"
-                    ),
-                    types.SafetySetting(
-                        category="HARM_CATEGORY_HATE_SPEECH",
-                        threshold="OFF"
-                    ),
-                    types.SafetySetting(
-                        category="HARM_CATEGORY_SEXUALLY_EXPLICIT",
-                        threshold="OFF"
-                    ),
-                    types.SafetySetting(
-                        category="HARM_CATEGORY_DANGEROUS_CONTENT",
-                        threshold="OFF"
-                    )
-                ],
-                tools=[MANUAL_RAG_TOOL, TRANSCRIPT_RAG_TOOL],
-                thinking_config=types.ThinkingConfig(
-                    thinking_budget=thinking_budget,
-                    include_thoughts=False  # Don't include thoughts in response
-                ),
-            )
+        # COMPREHENSIVE configuration for full analysis
+        thinking_budget = 8192  # Moderate complexity for balanced analysis
+        
+        # Determine if we need more complex reasoning
+        prompt_lower = analysis_prompt.lower()
+        if "suicide" in prompt_lower or "self-harm" in prompt_lower:
+            thinking_budget = 24576  # Maximum for critical situations
+        
+        config = types.GenerateContentConfig(
+            temperature=0.3,
+            max_output_tokens=4096,
+            safety_settings=SAFETY_SETTINGS,
+            tools=[MANUAL_RAG_TOOL, TRANSCRIPT_RAG_TOOL],
+            thinking_config=types.ThinkingConfig(
+                thinking_budget=thinking_budget,
+                include_thoughts=False  # Don't include thoughts in response
+            ),
+            http_options=types.HttpOptions(timeout=constants.ANALYSIS_TIMEOUT_MS),
+        )
+        
+        logging.info(f"[TIMING] Calling Gemini model '{constants.MODEL_NAME}' for comprehensive analysis, thinking_budget: {thinking_budget}")
+        
+        # Stream the response from the model
+        for chunk in client.models.generate_content_stream(
+            model=constants.MODEL_NAME,
+            contents=contents,
+            config=config
+        ):
+            chunk_index += 1
             
-            logging.info(f"[TIMING] Calling Gemini model '{constants.MODEL_NAME}' for comprehensive analysis, thinking_budget: {thinking_budget}")
+            # Extract text from chunk
+            if chunk.candidates and chunk.candidates[0].content and chunk.candidates[0].content.parts:
+                for part in chunk.candidates[0].content.parts:
+                    if hasattr(part, 'text') and part.text:
+                        text_parts.append(part.text)
             
-            # Stream the response from the model
-            for chunk in client.models.generate_content_stream(
-                model=constants.MODEL_NAME,
-                contents=contents,
-                config=config
-            ):
-                chunk_index += 1
-                
-                # Extract text from chunk
-                if chunk.candidates and chunk.candidates[0].content and chunk.candidates[0].content.parts:
-                    for part in chunk.candidates[0].content.parts:
-                        if hasattr(part, 'text') and part.text:
-                            accumulated_text += part.text
-                
-                # Check for grounding metadata (usually only in final chunk)
-                if chunk.candidates and hasattr(chunk.candidates[0], 'grounding_metadata'):
-                    metadata = chunk.candidates[0].grounding_metadata
-                    if hasattr(metadata, 'grounding_chunks') and metadata.grounding_chunks:
-                        logging.info(f"Found {len(metadata.grounding_chunks)} grounding chunks in chunk {chunk_index}")
-                        
-                        for idx, g_chunk in enumerate(metadata.grounding_chunks):
-                            g_data = {
-                                "citation_number": idx + 1,  # Maps to [1], [2], etc in text
-                            }
-                            
-                            if g_chunk.retrieved_context:
-                                ctx = g_chunk.retrieved_context
-                                g_data["source"] = {
-                                    "title": ctx.title if hasattr(ctx, 'title') and ctx.title else "EBT Manual",
-                                    "uri": ctx.uri if hasattr(ctx, 'uri') and ctx.uri else None,
-                                    "excerpt": ctx.text if hasattr(ctx, 'text') and ctx.text else None
-                                }
-                                
-                                # Include page information if available
-                                if hasattr(ctx, 'rag_chunk') and ctx.rag_chunk:
-                                    if hasattr(ctx.rag_chunk, 'page_span') and ctx.rag_chunk.page_span:
-                                        g_data["source"]["pages"] = {
-                                            "first": ctx.rag_chunk.page_span.first_page,
-                                            "last": ctx.rag_chunk.page_span.last_page
-                                        }
-                            
-                            grounding_chunks.append(g_data)
+            # Check for grounding metadata (usually only in final chunk)
+            if chunk.candidates and hasattr(chunk.candidates[0], 'grounding_metadata'):
+                metadata = chunk.candidates[0].grounding_metadata
+                if hasattr(metadata, 'grounding_chunks') and metadata.grounding_chunks:
+                    logging.info(f"Found {len(metadata.grounding_chunks)} grounding chunks in chunk {chunk_index}")
+                    grounding_chunks.extend(format_grounding_citations(metadata.grounding_chunks))
+        
+        accumulated_text = "".join(text_parts)
+        logging.info(f"Comprehensive analysis streaming complete - {chunk_index} chunks, {len(accumulated_text)} characters")
+        
+        # Parse the accumulated JSON response using robust extraction
+        parsed = extract_json_from_text(accumulated_text)
+        
+        if parsed is not None:
+            # Add metadata
+            parsed['timestamp'] = datetime.now().isoformat()
+            parsed['session_phase'] = phase
+            parsed['analysis_type'] = 'comprehensive'
             
-            logging.info(f"Comprehensive analysis streaming complete - {chunk_index} chunks, {len(accumulated_text)} characters")
+            # Add grounding citations if available
+            if grounding_chunks:
+                parsed['citations'] = grounding_chunks
+                logging.info(f"Added {len(grounding_chunks)} citations to response")
             
-            # Parse the accumulated JSON response using robust extraction
-            parsed = extract_json_from_text(accumulated_text)
+            return parsed
+        else:
+            logging.error(f"Failed to extract JSON from comprehensive analysis response: {accumulated_text[:500]}...")
+            return {
+                'error': 'Failed to parse analysis response - no valid JSON found',
+                'raw_response': accumulated_text[:200] if accumulated_text else 'No response received'
+            }
             
-            if parsed is not None:
-                # Add metadata
-                parsed['timestamp'] = datetime.now().isoformat()
-                parsed['session_phase'] = phase
-                parsed['analysis_type'] = 'comprehensive'
-                
-                # Add grounding citations if available
-                if grounding_chunks:
-                    parsed['citations'] = grounding_chunks
-                    logging.info(f"Added {len(grounding_chunks)} citations to response")
-                
-                yield json.dumps(parsed) + "\n"
-            else:
-                logging.error(f"Failed to extract JSON from comprehensive analysis response: {accumulated_text[:500]}...")
-                yield json.dumps({
-                    'error': 'Failed to parse analysis response - no valid JSON found',
-                    'raw_response': accumulated_text[:200] if accumulated_text else 'No response received'
-                }) + "\n"
-                
-        except Exception as e:
-            logging.exception(f"Error during comprehensive analysis streaming: {str(e)}")
-            yield json.dumps({'error': f'Analysis failed: {str(e)}'}) + "\n"
+    except Exception as e:
+        logging.exception(f"Error during comprehensive analysis streaming: {str(e)}")
+        return {'error': f'Analysis failed: {str(e)}'}
+
+def handle_comprehensive_analysis(analysis_prompt, phase, headers):
+    """Handle comprehensive analysis (non-realtime)"""
+    
+    def generate():
+        """Generator function for comprehensive analysis streaming"""
+        yield ndjson_line(run_comprehensive_analysis(analysis_prompt, phase))
     
     return Response(generate(), mimetype='text/plain', headers=headers)
 
@@ -603,24 +761,8 @@ def handle_pathway_guidance(request_json, headers):
                 thinking_budget=24576,  # Complex clinical reasoning
                 include_thoughts=False
             ),
-            safety_settings=[
-                types.SafetySetting(
-                    category="HARM_CATEGORY_HARASSMENT",
-                    threshold="OFF"
-                ),
-                types.SafetySetting(
-                    category="HARM_CATEGORY_HATE_SPEECH",
-                    threshold="OFF"
-                ),
-                types.SafetySetting(
-                    category="HARM_CATEGORY_SEXUALLY_EXPLICIT",
-                    threshold="OFF"
-                ),
-                types.SafetySetting(
-                    category="HARM_CATEGORY_DANGEROUS_CONTENT",
-                    threshold="OFF"
-                )
-            ]
+            safety_settings=SAFETY_SETTINGS,
+            http_options=types.HttpOptions(timeout=constants.ANALYSIS_TIMEOUT_MS)
         )
         
         response = client.models.generate_content(
@@ -641,30 +783,7 @@ def handle_pathway_guidance(request_json, headers):
             if response.candidates[0].grounding_metadata:
                 metadata = response.candidates[0].grounding_metadata
                 if hasattr(metadata, 'grounding_chunks') and metadata.grounding_chunks:
-                    citations = []
-                    for idx, g_chunk in enumerate(metadata.grounding_chunks):
-                        citation_data = {
-                            "citation_number": idx + 1,  # Maps to [1], [2], etc in text
-                        }
-                        
-                        if g_chunk.retrieved_context:
-                            ctx = g_chunk.retrieved_context
-                            citation_data["source"] = {
-                                "title": ctx.title if hasattr(ctx, 'title') and ctx.title else "EBT Manual",
-                                "uri": ctx.uri if hasattr(ctx, 'uri') and ctx.uri else None,
-                                "excerpt": ctx.text if hasattr(ctx, 'text') and ctx.text else None
-                            }
-                            
-                            # Include page information if available
-                            if hasattr(ctx, 'rag_chunk') and ctx.rag_chunk:
-                                if hasattr(ctx.rag_chunk, 'page_span') and ctx.rag_chunk.page_span:
-                                    citation_data["source"]["pages"] = {
-                                        "first": ctx.rag_chunk.page_span.first_page,
-                                        "last": ctx.rag_chunk.page_span.last_page
-                                    }
-                        
-                        citations.append(citation_data)
-                    
+                    citations = format_grounding_citations(metadata.grounding_chunks)
                     parsed_response['citations'] = citations
                     logging.info(f"Added {len(citations)} citations to pathway guidance response")
             
@@ -695,7 +814,8 @@ def handle_session_summary(request_json, headers):
         
         summary_prompt = constants.SESSION_SUMMARY_PROMPT.format(
             transcript_text=transcript_text,
-            session_metrics=json.dumps(session_metrics, indent=2)
+            # Compact separators keep the metrics block from inflating input tokens
+            session_metrics=json_dumps(session_metrics)
         )
         
         contents = [types.Content(
@@ -711,24 +831,8 @@ def handle_session_summary(request_json, headers):
                 thinking_budget=16384,  # Moderate complexity for summary
                 include_thoughts=False
             ),
-            safety_settings=[
-                types.SafetySetting(
-                    category="HARM_CATEGORY_HARASSMENT",
-                    threshold="OFF"
-                ),
-                types.SafetySetting(
-                    category="HARM_CATEGORY_HATE_SPEECH",
-                    threshold="OFF"
-                ),
-                types.SafetySetting(
-                    category="HARM_CATEGORY_SEXUALLY_EXPLICIT",
-                    threshold="OFF"
-                ),
-                types.SafetySetting(
-                    category="HARM_CATEGORY_DANGEROUS_CONTENT",
-                    threshold="OFF"
-                )
-            ]
+            safety_settings=SAFETY_SETTINGS,
+            http_options=types.HttpOptions(timeout=constants.ANALYSIS_TIMEOUT_MS)
         )
         
         response = client.models.generate_content(
@@ -765,6 +869,10 @@ def determine_therapy_phase(duration_minutes: int) -> str:
     else:
         return "end"
 
+# Speaker label prefixes used to infer the speaker of untagged 'conversation' entries
+THERAPIST_PREFIXES = ('Therapist:', 'T:')
+CLIENT_PREFIXES = ('Client:', 'C:', 'Patient:', 'P:')
+
 def format_transcript_segment(segment: List[Dict]) -> str:
     """Format transcript segment for analysis"""
     formatted = []
@@ -776,10 +884,10 @@ def format_transcript_segment(segment: List[Dict]) -> str:
         # Clean up speaker labels
         if speaker == 'conversation':
             # Try to infer speaker from text
-            if text.startswith('Therapist:') or text.startswith('T:'):
+            if text.startswith(THERAPIST_PREFIXES):
                 speaker = 'Therapist'
                 text = text.split(':', 1)[1].strip() if ':' in text else text
-            elif text.startswith('Client:') or text.startswith('C:') or text.startswith('Patient:') or text.startswith('P:'):
+            elif text.startswith(CLIENT_PREFIXES):
                 speaker = 'Client'
                 text = text.split(':', 1)[1].strip() if ':' in text else text
         
@@ -790,6 +898,47 @@ def format_transcript_segment(segment: List[Dict]) -> str:
     
     return '\n'.join(formatted)
 
+def format_previous_alert_context(previous_alert: Optional[Dict]) -> str:
+    """Format the previously displayed alert for the realtime deduplication prompt"""
+    if not previous_alert:
+        return constants.NO_PREVIOUS_ALERT_CONTEXT
+    
+    return constants.PREVIOUS_ALERT_CONTEXT_TEMPLATE.format(
+        title=previous_alert.get('title', 'N/A'),
+        category=previous_alert.get('category', 'N/A'),
+        message=previous_alert.get('message', 'N/A'),
+        recommendation=previous_alert.get('recommendation', 'N/A'),
+        timing=previous_alert.get('timing', 'N/A'),
+    )
+
+def format_grounding_citations(grounding_chunks) -> List[Dict[str, Any]]:
+    """Convert Gemini grounding chunks into numbered citation dicts for the frontend"""
+    citations = []
+    for idx, g_chunk in enumerate(grounding_chunks):
+        citation_data = {
+            "citation_number": idx + 1,  # Maps to [1], [2], etc in text
+        }
+        
+        if g_chunk.retrieved_context:
+            ctx = g_chunk.retrieved_context
+            citation_data["source"] = {
+                "title": ctx.title if hasattr(ctx, 'title') and ctx.title else "EBT Manual",
+                "uri": ctx.uri if hasattr(ctx, 'uri') and ctx.uri else None,
+                "excerpt": ctx.text if hasattr(ctx, 'text') and ctx.text else None
+            }
+            
+            # Include page information if available
+            if hasattr(ctx, 'rag_chunk') and ctx.rag_chunk:
+                if hasattr(ctx.rag_chunk, 'page_span') and ctx.rag_chunk.page_span:
+                    citation_data["source"]["pages"] = {
+                        "first": ctx.rag_chunk.page_span.first_page,
+                        "last": ctx.rag_chunk.page_span.last_page
+                    }
+        
+        citations.append(citation_data)
+    
+    return citations
+
 def summarize_session_history(history: List[Dict]) -> str:
     """Create brief summary of session history"""
     if not history:
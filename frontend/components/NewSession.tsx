@@ -397,6 +397,8 @@ const NewSession: React.FC<NewSessionProps> = ({ onNavigateBack, patientId }) =>
       // Trigger analysis every 10 words
       const WORDS_PER_ANALYSIS = 10;
       const TRANSCRIPT_WINDOW_MINUTES = 5;
+      // Real-time guidance only looks at the last few sentences
+      const REALTIME_TRANSCRIPT_ENTRIES = 5;
       
       if (updatedWordCount >= WORDS_PER_ANALYSIS) {
         console.log(`[Session] 🔄 Auto-analysis triggered (${updatedWordCount} words)`);
@@ -417,7 +419,7 @@ const NewSession: React.FC<NewSessionProps> = ({ onNavigateBack, patientId }) =>
           
           // Trigger both real-time and comprehensive analysis
           analyzeSegmentRef.current(
-            recentTranscript,
+            recentTranscript.slice(-REALTIME_TRANSCRIPT_ENTRIES),
             { ...sessionContextRef.current, is_realtime: true },
             Math.floor(sessionDurationRef.current / 60),
             recentAlert
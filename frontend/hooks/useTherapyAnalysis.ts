@@ -16,6 +16,9 @@ import { useCallback } from 'react';
 import axios from 'axios';
 import { AnalysisResponse, SessionContext } from '../types/types';
 
+// Request/response dumps retain full transcripts in the console; only emit them in dev builds
+const VERBOSE_LOGGING = import.meta.env.DEV;
+
 interface UseTherapyAnalysisProps {
   onAnalysis: (analysis: AnalysisResponse) => void;
   onPathwayGuidance?: (guidance: any) => void;
@@ -50,46 +53,74 @@ export const useTherapyAnalysis = ({
       previous_alert: previousAlert || null,
     };
     
-    console.log(`[Analysis] 📤 ${analysisType.toUpperCase()} REQUEST:`, requestPayload);
+    if (VERBOSE_LOGGING) console.log(`[Analysis] 📤 ${analysisType.toUpperCase()} REQUEST:`, requestPayload);
     
     const startTime = performance.now();
     
     try {
-      const response = await axios.post(`${ANALYSIS_API}/therapy_analysis`, requestPayload, {
-        responseType: 'text',
+      const response = await fetch(`${ANALYSIS_API}/therapy_analysis`, {
+        method: 'POST',
         headers: {
+          'Content-Type': 'application/json',
           ...(authToken && { Authorization: `Bearer ${authToken}` })
-        }
+        },
+        body: JSON.stringify(requestPayload),
       });
 
-      const responseTime = performance.now() - startTime;
-      const text = response.data;
-      
-      if (text) {
-        const lines = text.split('\n').filter(Boolean);
-        
-        for (const line of lines) {
-          try {
-            const analysis = JSON.parse(line);
-            
-            console.log(`[Analysis] 📥 ${analysisType.toUpperCase()} RESPONSE (${responseTime.toFixed(0)}ms):`, analysis);
-            
-            // Always call onAnalysis if we have valid data
-            if (analysis.alert || analysis.session_metrics || analysis.pathway_indicators) {
-              onAnalysis(analysis as AnalysisResponse);
-            }
-          } catch (e) {
-            console.error('[Analysis] ❌ Parse error:', e, 'Line:', line.substring(0, 100));
+      if (!response.ok || !response.body) {
+        console.error('[Analysis] ❌ Request failed:', {
+          status: response.status,
+          data: await response.text()
+        });
+        return;
+      }
+
+      let receivedLines = 0;
+      const handleLine = (line: string) => {
+        receivedLines++;
+        const responseTime = performance.now() - startTime;
+        try {
+          const analysis = JSON.parse(line);
+          
+          if (VERBOSE_LOGGING) console.log(`[Analysis] 📥 ${analysisType.toUpperCase()} RESPONSE (${responseTime.toFixed(0)}ms):`, analysis);
+          
+          // Always call onAnalysis if we have valid data
+          if (analysis.alert || analysis.session_metrics || analysis.pathway_indicators) {
+            onAnalysis(analysis as AnalysisResponse);
           }
+        } catch (e) {
+          console.error('[Analysis] ❌ Parse error:', e, 'Line:', line.substring(0, 100));
         }
-      } else {
+      };
+
+      // Dispatch each NDJSON line as soon as it arrives instead of buffering the whole body
+      const reader = response.body.getReader();
+      const decoder = new TextDecoder();
+      let buffered = '';
+      while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffered += decoder.decode(value, { stream: true });
+        
+        // Walk complete lines by offset and drop them from the buffer once per read
+        let lineStart = 0;
+        let newlineIndex: number;
+        while ((newlineIndex = buffered.indexOf('\n', lineStart)) >= 0) {
+          const line = buffered.slice(lineStart, newlineIndex).trim();
+          lineStart = newlineIndex + 1;
+          if (line) handleLine(line);
+        }
+        buffered = buffered.slice(lineStart);
+      }
+      buffered += decoder.decode();
+      if (buffered.trim()) handleLine(buffered.trim());
+
+      if (receivedLines === 0) {
         console.warn('[Analysis] ⚠️ Empty response from backend');
       }
     } catch (error: any) {
       console.error('[Analysis] ❌ Request failed:', {
-        message: error.message,
-        status: error.response?.status,
-        data: error.response?.data
+        message: error.message
       });
     }
   }, [onAnalysis, ANALYSIS_API, authToken]);
@@ -101,7 +132,7 @@ export const useTherapyAnalysis = ({
   ) => {
     const startTime = performance.now();
     
-    console.log(`[Pathway] 📤 REQUEST:`, {
+    if (VERBOSE_LOGGING) console.log(`[Pathway] 📤 REQUEST:`, {
       approach: currentApproach,
       historyItems: sessionHistory.length,
       issues: presentingIssues
@@ -120,7 +151,7 @@ export const useTherapyAnalysis = ({
       });
 
       const responseTime = performance.now() - startTime;
-      console.log(`[Pathway] 📥 RESPONSE (${responseTime.toFixed(0)}ms):`, {
+      if (VERBOSE_LOGGING) console.log(`[Pathway] 📥 RESPONSE (${responseTime.toFixed(0)}ms):`, {
         hasGuidance: !!response.data,
         keys: response.data ? Object.keys(response.data) : []
       });
@@ -152,7 +183,7 @@ export const useTherapyAnalysis = ({
           full_transcript: fullTranscript,
           session_metrics: sessionMetrics,
         }
-      console.log(`[Summary] 📤 REQUEST:`, summaryReqBody);
+      if (VERBOSE_LOGGING) console.log(`[Summary] 📤 REQUEST:`, summaryReqBody);
       const response = await axios.post(`${ANALYSIS_API}/therapy_analysis`, summaryReqBody, {
         headers: {
           ...(authToken && { Authorization: `Bearer ${authToken}` })
@@ -160,7 +191,7 @@ export const useTherapyAnalysis = ({
       });
 
       const responseTime = performance.now() - startTime;
-      console.log(`[Summary] 📥 RESPONSE (${responseTime.toFixed(0)}ms):`, response.data);
+      if (VERBOSE_LOGGING) console.log(`[Summary] 📥 RESPONSE (${responseTime.toFixed(0)}ms):`, response.data);
       
       if (onSessionSummary && response.data) {
         onSessionSummary(response.data);
@@ -105,6 +105,19 @@ function extractKeyPhrases(text: string): Set<string> {
   return keyPhrases;
 }
 
+/**
+ * Count alerts by category in a single pass (used for debug output)
+ */
+function countAlertsByCategory(alerts: Alert[]) {
+  const counts = { total: alerts.length, safety: 0, technique: 0, pathway_change: 0 };
+  for (const alert of alerts) {
+    if (alert.category === 'safety') counts.safety++;
+    else if (alert.category === 'technique') counts.technique++;
+    else if (alert.category === 'pathway_change') counts.pathway_change++;
+  }
+  return counts;
+}
+
 /**
  * Check if a new alert should be blocked due to similarity with existing alerts
  */
@@ -240,12 +253,7 @@ export function processNewAlert(
       category: newAlert.category,
       timing: newAlert.timing,
     },
-    alertCounts: {
-      total: existingAlerts.length,
-      safety: existingAlerts.filter(a => a.category === 'safety').length,
-      technique: existingAlerts.filter(a => a.category === 'technique').length,
-      pathway_change: existingAlerts.filter(a => a.category === 'pathway_change').length,
-    }
+    alertCounts: countAlertsByCategory(existingAlerts),
   } : undefined;
   
   if (blockResult.shouldBlock) {
@@ -24,9 +24,9 @@ from google import genai
 from google.genai import types
 
 
-def save_binary_file(file_name, data):
+def save_binary_file(file_name, *chunks):
     f = open(file_name, "wb")
-    f.write(data)
+    f.writelines(chunks)
     f.close()
     print(f"File saved to to: {file_name}")
 
@@ -119,20 +119,22 @@ Speaker 1 (Patient): Yes, I can feel them. That helps a bit.
             file_name = f"ENTER_FILE_NAME_{file_index}"
             file_index += 1
             inline_data = chunk.candidates[0].content.parts[0].inline_data
-            data_buffer = inline_data.data
             file_extension = mimetypes.guess_extension(inline_data.mime_type)
             if file_extension is None:
+                # Write the header and the raw PCM separately rather than copying the audio into a new buffer
                 file_extension = ".wav"
-                data_buffer = convert_to_wav(inline_data.data, inline_data.mime_type)
-            save_binary_file(f"{file_name}{file_extension}", data_buffer)
+                header = wav_header(len(inline_data.data), inline_data.mime_type)
+                save_binary_file(f"{file_name}{file_extension}", header, inline_data.data)
+            else:
+                save_binary_file(f"{file_name}{file_extension}", inline_data.data)
         else:
             print(chunk.text)
 
-def convert_to_wav(audio_data: bytes, mime_type: str) -> bytes:
-    """Generates a WAV file header for the given audio data and parameters.
+def wav_header(data_size: int, mime_type: str) -> bytes:
+    """Generates a WAV file header for audio data of the given size and parameters.
 
     Args:
-        audio_data: The raw audio data as a bytes object.
+        data_size: Size of the raw audio data in bytes.
         mime_type: Mime type of the audio data.
 
     Returns:
@@ -142,7 +144,6 @@ def convert_to_wav(audio_data: bytes, mime_type: str) -> bytes:
     bits_per_sample = parameters["bits_per_sample"]
     sample_rate = parameters["rate"]
     num_channels = 1
-    data_size = len(audio_data)
     bytes_per_sample = bits_per_sample // 8
     block_align = num_channels * bytes_per_sample
     byte_rate = sample_rate * block_align
@@ -166,7 +167,7 @@ def convert_to_wav(audio_data: bytes, mime_type: str) -> bytes:
         b"data",          # Subchunk2ID
         data_size         # Subchunk2Size (size of audio data)
     )
-    return header + audio_data
+    return header
 
 def parse_audio_mime_type(mime_type: str) -> dict[str, int | None]:
     """Parses bits per sample and rate from an audio MIME type string.
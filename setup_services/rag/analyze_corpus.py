@@ -29,6 +29,53 @@ except ImportError:
     PYPDF_AVAILABLE = False
     print("PyPDF2 not available - will use basic analysis")
 
+# Section separator for the report output
+SEPARATOR = "=" * 60
+
+# Parser recommendations are static, so the whole report is formatted once and written in one call
+PARSER_RECOMMENDATIONS_REPORT = f"""
+{SEPARATOR}
+PARSER RECOMMENDATIONS:
+{SEPARATOR}
+
+Based on the analysis:
+
+1. **Layout Parser** (RECOMMENDED)
+   - Best for structured therapy manuals with sections, chapters, and tables
+   - Detects document elements: paragraphs, tables, lists, headings
+   - Enables content-aware chunking for better RAG performance
+   - Works well with both PDF and DOCX formats
+
+2. **Digital Parser** (NOT RECOMMENDED)
+   - Only extracts text blocks without structure
+   - Would lose important formatting and hierarchy
+
+3. **OCR Parser** (NOT NEEDED)
+   - Only needed for scanned PDFs
+   - Your files appear to be digital PDFs with extractable text
+
+RECOMMENDED CONFIGURATION:
+
+    "documentProcessingConfig": {{
+        "chunkingConfig": {{
+            "layoutBasedChunkingConfig": {{
+                "chunkSize": 500,
+                "includeAncestorHeadings": true
+            }}
+        }},
+        "defaultParsingConfig": {{
+            "layoutParsingConfig": {{}}
+        }}
+    }}
+    
+
+This configuration will:
+- Parse documents to detect structure (headings, sections, tables)
+- Create 500-token chunks that respect document boundaries
+- Include ancestor headings for context (e.g., 'Chapter 3 > Section 2')
+- Optimize retrieval for therapy guidance queries
+"""
+
 def analyze_pdf(file_path):
     """Analyze a PDF file to determine its characteristics."""
     print(f"\nAnalyzing PDF: {file_path.name}")
@@ -96,48 +143,9 @@ def analyze_corpus():
             analyze_docx(file_path)
     
     # Recommendations
-    print("\n" + "="*60)
-    print("PARSER RECOMMENDATIONS:")
-    print("="*60)
-    
-    print("\nBased on the analysis:")
-    print("\n1. **Layout Parser** (RECOMMENDED)")
-    print("   - Best for structured therapy manuals with sections, chapters, and tables")
-    print("   - Detects document elements: paragraphs, tables, lists, headings")
-    print("   - Enables content-aware chunking for better RAG performance")
-    print("   - Works well with both PDF and DOCX formats")
-    
-    print("\n2. **Digital Parser** (NOT RECOMMENDED)")
-    print("   - Only extracts text blocks without structure")
-    print("   - Would lose important formatting and hierarchy")
-    
-    print("\n3. **OCR Parser** (NOT NEEDED)")
-    print("   - Only needed for scanned PDFs")
-    print("   - Your files appear to be digital PDFs with extractable text")
-    
-    print("\nRECOMMENDED CONFIGURATION:")
-    print("""
-    "documentProcessingConfig": {
-        "chunkingConfig": {
-            "layoutBasedChunkingConfig": {
-                "chunkSize": 500,
-                "includeAncestorHeadings": true
-            }
-        },
-        "defaultParsingConfig": {
-            "layoutParsingConfig": {}
-        }
-    }
-    """)
-    
-    print("\nThis configuration will:")
-    print("- Parse documents to detect structure (headings, sections, tables)")
-    print("- Create 500-token chunks that respect document boundaries")
-    print("- Include ancestor headings for context (e.g., 'Chapter 3 > Section 2')")
-    print("- Optimize retrieval for therapy guidance queries")
+    sys.stdout.write(PARSER_RECOMMENDATIONS_REPORT)
 
 if __name__ == "__main__":
-    print("Corpus File Analysis for Vertex AI Search Parser Selection")
-    print("="*60)
+    print(f"Corpus File Analysis for Vertex AI Search Parser Selection\n{SEPARATOR}")
     
     analyze_corpus()
@@ -0,0 +1,116 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Shared HTTP, credential and operation-polling helpers for the Vertex AI Search setup scripts.
+Cloud and HTTP libraries are imported on first use, so offline modes such as a dry run work without them.
+"""
+
+import os
+import socket
+import time
+
+PROJECT_ID = os.environ.get("GOOGLE_CLOUD_PROJECT")
+
+# (connect, read) timeouts for Discovery Engine API calls: fail fast if the API is unreachable,
+# but allow the control-plane call itself time to respond
+HTTP_TIMEOUT = (5, 60)
+
+# Operation status polling interval bounds (seconds)
+POLL_INITIAL_INTERVAL = 2
+POLL_MAX_INTERVAL = 30
+
+def create_http_session():
+    """Create a pooled HTTP session that retries transient server errors."""
+    import requests
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
+
+    class LowLatencyAdapter(HTTPAdapter):
+        """HTTPAdapter whose pooled sockets disable Nagle's algorithm and use TCP keep-alive."""
+
+        def init_poolmanager(self, *args, **kwargs):
+            kwargs["socket_options"] = [
+                (socket.IPPROTO_TCP, socket.TCP_NODELAY, 1),
+                (socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1),
+            ]
+            super().init_poolmanager(*args, **kwargs)
+
+    session = requests.Session()
+    retry = Retry(total=3, backoff_factor=0.3, status_forcelist=[502, 503, 504], raise_on_status=False)
+    session.mount("https://", LowLatencyAdapter(pool_connections=4, pool_maxsize=8, max_retries=retry))
+    return session
+
+# Shared session so repeated API calls and status polls reuse connections, created on first use
+_http_session = None
+
+def get_http_session():
+    """Return the shared HTTP session."""
+    global _http_session
+    if _http_session is None:
+        _http_session = create_http_session()
+    return _http_session
+
+# Application default credentials, loaded once and refreshed only when the token expires
+_credentials = None
+
+def get_access_token():
+    """Get access token for API calls."""
+    global _credentials
+    from google.auth import default
+    from google.auth.transport.requests import Request
+
+    if _credentials is None:
+        _credentials, _ = default()
+    if not _credentials.valid:
+        _credentials.refresh(Request())
+    return _credentials.token
+
+# Cloud Storage client shared by every GCS step, created on first use
+_storage_client = None
+
+def get_storage_client():
+    """Return the shared Cloud Storage client."""
+    global _storage_client
+    if _storage_client is None:
+        from google.cloud import storage
+        _storage_client = storage.Client(project=PROJECT_ID)
+    return _storage_client
+
+def poll_operation(operation_name, headers, timeout=600):
+    """
+    Poll a long-running Discovery Engine operation until it finishes.
+    Returns (operation, None) when done, (None, response) if a status check fails,
+    or (None, None) if the timeout expires first.
+    """
+    url = f"https://discoveryengine.googleapis.com/v1/{operation_name}"
+    start_time = time.time()
+    poll_interval = POLL_INITIAL_INTERVAL
+
+    while time.time() - start_time < timeout:
+        response = get_http_session().get(url, headers=headers, timeout=HTTP_TIMEOUT)
+        if response.status_code != 200:
+            return None, response
+
+        operation = response.json()
+        if operation.get("done"):
+            return operation, None
+
+        elapsed = int(time.time() - start_time)
+        print(f"⏳ Waiting for operation to complete... ({elapsed}/{timeout} seconds)")
+        # Back off exponentially: short operations finish fast, long ones are not over-polled
+        time.sleep(min(poll_interval, max(0, timeout - (time.time() - start_time))))
+        poll_interval = min(poll_interval * 2, POLL_MAX_INTERVAL)
+
+    return None, None
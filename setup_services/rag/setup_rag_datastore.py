@@ -19,11 +19,8 @@ This datastore will be configured to process EBT therapy manuals with layout-awa
 """
 
 import os
-import time
 import json
-from google.auth import default
-from google.auth.transport.requests import Request
-import requests
+from setup_common import HTTP_TIMEOUT, get_access_token, get_http_session, get_storage_client, poll_operation
 
 # Configuration
 PROJECT_ID = os.environ.get("GOOGLE_CLOUD_PROJECT")
@@ -31,12 +28,6 @@ LOCATION = "global"
 DATASTORE_ID = "ebt-corpus"
 DISPLAY_NAME = "EBT Therapy Manuals Corpus"
 
-def get_access_token():
-    """Get access token for API calls."""
-    credentials, _ = default()
-    credentials.refresh(Request())
-    return credentials.token
-
 def create_datastore():
     """Create a Vertex AI Search datastore with document chunking enabled."""
     
@@ -86,7 +77,7 @@ def create_datastore():
     
     print(f"Creating datastore '{DATASTORE_ID}' with layout-aware chunking...")
     
-    response = requests.post(url, headers=headers, json=data)
+    response = get_http_session().post(url, headers=headers, json=data, timeout=HTTP_TIMEOUT)
     
     if response.status_code == 200:
         print(f"✅ Datastore '{DATASTORE_ID}' created successfully!")
@@ -108,7 +99,7 @@ def get_datastore():
         "X-Goog-User-Project": PROJECT_ID
     }
     
-    response = requests.get(url, headers=headers)
+    response = get_http_session().get(url, headers=headers, timeout=HTTP_TIMEOUT)
     
     if response.status_code == 200:
         return response.json()
@@ -119,10 +110,8 @@ def get_datastore():
 
 def create_gcs_bucket():
     """Create a GCS bucket for storing the EBT corpus documents."""
-    from google.cloud import storage
-    
     bucket_name = f"{PROJECT_ID}-ebt-corpus"
-    client = storage.Client(project=PROJECT_ID)
+    client = get_storage_client()
     
     # Check if bucket already exists
     try:
@@ -147,9 +136,7 @@ def create_gcs_bucket():
 
 def upload_corpus_to_gcs(bucket_name):
     """Upload EBT corpus files to GCS bucket."""
-    from google.cloud import storage
-    
-    client = storage.Client(project=PROJECT_ID)
+    client = get_storage_client()
     bucket = client.bucket(bucket_name)
     
     corpus_dir = "corpus"  # Since we run from backend/rag
@@ -177,18 +164,16 @@ def upload_corpus_to_gcs(bucket_name):
                 print(f"  ❌ Failed to upload {filename}: {e}")
                 files_failed += 1
     
-    print(f"\n📊 Upload Summary:")
-    print(f"  ✅ Successfully uploaded: {files_uploaded} files")
+    summary = [f"\n📊 Upload Summary:", f"  ✅ Successfully uploaded: {files_uploaded} files"]
     if files_failed > 0:
-        print(f"  ❌ Failed to upload: {files_failed} files")
+        summary.append(f"  ❌ Failed to upload: {files_failed} files")
+    print("\n".join(summary))
     return files_uploaded > 0
 
 def import_documents_to_datastore(bucket_name):
     """Import documents from GCS to the datastore."""
-    from google.cloud import storage
-    
     # First, create a metadata JSONL file for document import
-    client = storage.Client(project=PROJECT_ID)
+    client = get_storage_client()
     bucket = client.bucket(bucket_name)
     
     # List all corpus files
@@ -252,7 +237,7 @@ def import_documents_to_datastore(bucket_name):
     for file in corpus_files:
         print(f"  - {file}")
     
-    response = requests.post(url, headers=headers, json=data)
+    response = get_http_session().post(url, headers=headers, json=data, timeout=HTTP_TIMEOUT)
     
     if response.status_code == 200:
         operation = response.json()
@@ -271,55 +256,50 @@ def wait_for_operation(operation_name, timeout=600):
         "X-Goog-User-Project": PROJECT_ID
     }
     
-    start_time = time.time()
-    elapsed = 0
+    operation, error_response = poll_operation(operation_name, headers, timeout)
     
-    while time.time() - start_time < timeout:
-        url = f"https://discoveryengine.googleapis.com/v1/{operation_name}"
-        response = requests.get(url, headers=headers)
-        
-        if response.status_code == 200:
-            operation = response.json()
-            if operation.get("done"):
-                if "error" in operation:
-                    error_detail = operation.get('error', {})
-                    print(f"\n❌❌❌ IMPORT OPERATION FAILED ❌❌❌")
-                    print(f"Error Code: {error_detail.get('code', 'Unknown')}")
-                    print(f"Error Message: {error_detail.get('message', 'No message provided')}")
-                    if 'details' in error_detail:
-                        print(f"Error Details: {json.dumps(error_detail['details'], indent=2)}")
-                    print("❌❌❌❌❌❌❌❌❌❌❌❌❌❌❌❌❌❌❌❌❌❌")
-                    return False
-                else:
-                    # Check for partial failures in metadata
-                    metadata = operation.get('metadata', {})
-                    if metadata.get('successCount'):
-                        print(f"\n✅ Operation completed!")
-                        print(f"  📊 Import Statistics:")
-                        print(f"    - Success Count: {metadata.get('successCount', 0)}")
-                        print(f"    - Failure Count: {metadata.get('failureCount', 0)}")
-                        print(f"    - Update Time: {metadata.get('updateTime', 'N/A')}")
-                        
-                        # Check for any partial failures
-                        if metadata.get('failureCount', 0) > 0:
-                            print(f"\n  ⚠️  Warning: {metadata.get('failureCount')} documents failed to import")
-                            print(f"     Check the Google Cloud Console for details")
-                    else:
-                        print(f"✅ Operation completed successfully!")
-                    return True
-        else:
-            print(f"❌ Error checking operation status: {response.status_code}")
-            print(f"   Response: {response.text}")
-            return False
+    if error_response is not None:
+        print(f"❌ Error checking operation status: {error_response.status_code}")
+        print(f"   Response: {error_response.text}")
+        return False
+    if operation is None:
+        print(f"❌ Operation timed out after {timeout} seconds")
+        print(f"   Operation name: {operation_name}")
+        print(f"   Check the Google Cloud Console for status")
+        return False
+    
+    if "error" in operation:
+        error_detail = operation.get('error', {})
+        report = [
+            f"\n❌❌❌ IMPORT OPERATION FAILED ❌❌❌",
+            f"Error Code: {error_detail.get('code', 'Unknown')}",
+            f"Error Message: {error_detail.get('message', 'No message provided')}",
+        ]
+        if 'details' in error_detail:
+            report.append(f"Error Details: {json.dumps(error_detail['details'], indent=2)}")
+        report.append("❌❌❌❌❌❌❌❌❌❌❌❌❌❌❌❌❌❌❌❌❌❌")
+        print("\n".join(report))
+        return False
+    
+    # Check for partial failures in metadata
+    metadata = operation.get('metadata', {})
+    if metadata.get('successCount'):
+        report = [
+            f"\n✅ Operation completed!",
+            f"  📊 Import Statistics:",
+            f"    - Success Count: {metadata.get('successCount', 0)}",
+            f"    - Failure Count: {metadata.get('failureCount', 0)}",
+            f"    - Update Time: {metadata.get('updateTime', 'N/A')}",
+        ]
         
-        elapsed = int(time.time() - start_time)
-        print(f"⏳ Waiting for operation to complete... ({elapsed}/{timeout} seconds)")
-        time.sleep(10)
-    
-    print(f"❌ Operation timed out after {timeout} seconds")
-    print(f"   Operation name: {operation_name}")
-    print(f"   Check the Google Cloud Console for status")
-    return False
+        # Check for any partial failures
+        if metadata.get('failureCount', 0) > 0:
+            report.append(f"\n  ⚠️  Warning: {metadata.get('failureCount')} documents failed to import")
+            report.append(f"     Check the Google Cloud Console for details")
+        print("\n".join(report))
+    else:
+        print(f"✅ Operation completed successfully!")
+    return True
 
 def update_datastore_path_in_code():
     """Update the datastore path in the therapy analysis function."""
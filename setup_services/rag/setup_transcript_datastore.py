@@ -20,12 +20,9 @@ to preserve conversational context and therapeutic patterns.
 """
 
 import os
-import time
 import json
-from google.auth import default
-from google.auth.transport.requests import Request
-import requests
 import PyPDF2
+from setup_common import HTTP_TIMEOUT, get_access_token, get_http_session, get_storage_client, poll_operation
 
 # Configuration
 PROJECT_ID = os.environ.get("GOOGLE_CLOUD_PROJECT")
@@ -33,12 +30,6 @@ LOCATION = "global"
 DATASTORE_ID = "transcript-patterns"
 DISPLAY_NAME = "Clinical Therapy Transcripts"
 
-def get_access_token():
-    """Get access token for API calls."""
-    credentials, _ = default()
-    credentials.refresh(Request())
-    return credentials.token
-
 def create_datastore():
     """Create a Vertex AI Search datastore with dialogue-aware chunking."""
     
@@ -73,7 +64,7 @@ def create_datastore():
     
     print(f"Creating datastore '{DATASTORE_ID}' with dialogue-aware chunking...")
     
-    response = requests.post(url, headers=headers, json=data)
+    response = get_http_session().post(url, headers=headers, json=data, timeout=HTTP_TIMEOUT)
     
     if response.status_code == 200:
         print(f"✅ Datastore '{DATASTORE_ID}' created successfully!")
@@ -95,7 +86,7 @@ def get_datastore():
         "X-Goog-User-Project": PROJECT_ID
     }
     
-    response = requests.get(url, headers=headers)
+    response = get_http_session().get(url, headers=headers, timeout=HTTP_TIMEOUT)
     
     if response.status_code == 200:
         return response.json()
@@ -106,10 +97,8 @@ def get_datastore():
 
 def create_gcs_bucket():
     """Create a GCS bucket for storing the transcript documents."""
-    from google.cloud import storage
-    
     bucket_name = f"{PROJECT_ID}-transcript-patterns"
-    client = storage.Client(project=PROJECT_ID)
+    client = get_storage_client()
     
     # Check if bucket already exists
     try:
@@ -137,28 +126,25 @@ def process_json_conversation(json_path):
     with open(json_path, 'r') as f:
         data = json.load(f)
     
-    # Format as dialogue with 3-turn sequences
-    formatted_content = []
     conversation = data.get('messages', data.get('conversation', []))
     
-    # Create overlapping 3-turn sequences for better pattern matching
-    for i in range(len(conversation) - 2):
-        sequence = []
-        for j in range(3):
-            if i + j < len(conversation):
-                msg = conversation[i + j]
-                role = msg.get('role', 'Unknown')
-                content = msg.get('content', msg.get('text', ''))
-                sequence.append(f"{role}: {content}")
-        
-        if len(sequence) >= 2:  # At least 2 turns
-            formatted_content.append("\n".join(sequence))
-            formatted_content.append("\n---\n")  # Separator between sequences
+    # Format each turn once; the overlapping windows below reuse the formatted lines
+    turns = [
+        f"{msg.get('role', 'Unknown')}: {msg.get('content', msg.get('text', ''))}"
+        for msg in conversation
+    ]
     
     # Add metadata about the session
     session_type = "PTSD" if "trauma" in json_path.lower() else "General"
-    formatted_content.insert(0, f"Session Type: {session_type}\n")
-    formatted_content.insert(1, f"File: {os.path.basename(json_path)}\n\n")
+    formatted_content = [
+        f"Session Type: {session_type}\n",
+        f"File: {os.path.basename(json_path)}\n\n",
+    ]
+    
+    # Create overlapping 3-turn sequences for better pattern matching
+    for i in range(len(turns) - 2):
+        formatted_content.append("\n".join(turns[i:i + 3]))
+        formatted_content.append("\n---\n")  # Separator between sequences
     
     return "\n".join(formatted_content)
 
@@ -167,13 +153,9 @@ def process_pdf_transcript(pdf_path):
     try:
         with open(pdf_path, 'rb') as file:
             pdf_reader = PyPDF2.PdfReader(file)
-            text = []
-            
-            for page_num in range(len(pdf_reader.pages)):
-                page = pdf_reader.pages[page_num]
-                text.append(page.extract_text())
             
-            full_text = "\n".join(text)
+            # Iterate pages directly rather than re-indexing into the page list
+            full_text = "\n".join(page.extract_text() for page in pdf_reader.pages)
             
             # Add metadata
             session_type = "Beck CBT" if "BB3" in pdf_path else "PE/PTSD" if "PE" in pdf_path else "General"
@@ -186,9 +168,7 @@ def process_pdf_transcript(pdf_path):
 
 def upload_transcripts_to_gcs(bucket_name):
     """Upload transcript files to GCS bucket."""
-    from google.cloud import storage
-    
-    client = storage.Client(project=PROJECT_ID)
+    client = get_storage_client()
     bucket = client.bucket(bucket_name)
     
     transcripts_dir = "transcripts"  # Since we're running from backend/rag
@@ -234,9 +214,7 @@ def upload_transcripts_to_gcs(bucket_name):
 
 def create_pattern_library(bucket_name):
     """Create a pattern library document with key therapeutic moments."""
-    from google.cloud import storage
-    
-    client = storage.Client(project=PROJECT_ID)
+    client = get_storage_client()
     bucket = client.bucket(bucket_name)
     
     # Define key patterns from the transcripts
@@ -354,7 +332,7 @@ def import_documents_to_datastore(bucket_name):
     
     print(f"Importing documents from GCS to datastore...")
     
-    response = requests.post(url, headers=headers, json=data)
+    response = get_http_session().post(url, headers=headers, json=data, timeout=HTTP_TIMEOUT)
     
     if response.status_code == 200:
         operation = response.json()
@@ -373,30 +351,20 @@ def wait_for_operation(operation_name, timeout=600):
         "X-Goog-User-Project": PROJECT_ID
     }
     
-    start_time = time.time()
+    operation, error_response = poll_operation(operation_name, headers, timeout)
     
-    while time.time() - start_time < timeout:
-        url = f"https://discoveryengine.googleapis.com/v1/{operation_name}"
-        response = requests.get(url, headers=headers)
-        
-        if response.status_code == 200:
-            operation = response.json()
-            if operation.get("done"):
-                if "error" in operation:
-                    print(f"❌ Operation failed: {operation['error']}")
-                    return False
-                else:
-                    print(f"✅ Operation completed successfully!")
-                    return True
-        else:
-            print(f"❌ Error checking operation status: {response.status_code}")
-            return False
-        
-        print("⏳ Waiting for operation to complete...")
-        time.sleep(10)
+    if error_response is not None:
+        print(f"❌ Error checking operation status: {error_response.status_code}")
+        return False
+    if operation is None:
+        print(f"❌ Operation timed out after {timeout} seconds")
+        return False
+    if "error" in operation:
+        print(f"❌ Operation failed: {operation['error']}")
+        return False
     
-    print(f"❌ Operation timed out after {timeout} seconds")
-    return False
+    print(f"✅ Operation completed successfully!")
+    return True
 
 def update_backend_with_transcript_rag():
     """Update the therapy analysis function to include transcript RAG tool."""
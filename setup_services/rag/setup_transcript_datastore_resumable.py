@@ -21,13 +21,11 @@ This version includes skip logic, progress tracking, and error recovery.
 import os
 import time
 import json
-import pickle
-from pathlib import Path
-from google.auth import default
-from google.auth.transport.requests import Request
-import requests
-import PyPDF2
+import argparse
+import importlib.util
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from typing import Set, Dict, Any
+from setup_common import HTTP_TIMEOUT, get_access_token, get_http_session, get_storage_client, poll_operation
 
 # Configuration
 PROJECT_ID = os.environ.get("GOOGLE_CLOUD_PROJECT")
@@ -38,6 +36,9 @@ DISPLAY_NAME = "Clinical Therapy Transcripts"
 # Progress tracking file
 PROGRESS_FILE = "transcript_upload_progress.json"
 
+# Number of files processed and uploaded concurrently within a batch
+UPLOAD_WORKERS = 8
+
 class ProgressTracker:
     """Track upload progress to enable resumability."""
     
@@ -99,12 +100,6 @@ class ProgressTracker:
             os.remove(self.progress_file)
         print("🔄 Progress tracker reset")
 
-def get_access_token():
-    """Get access token for API calls."""
-    credentials, _ = default()
-    credentials.refresh(Request())
-    return credentials.token
-
 def create_datastore():
     """Create a Vertex AI Search datastore with dialogue-aware chunking."""
     
@@ -139,7 +134,7 @@ def create_datastore():
     
     print(f"Creating datastore '{DATASTORE_ID}' with dialogue-aware chunking...")
     
-    response = requests.post(url, headers=headers, json=data)
+    response = get_http_session().post(url, headers=headers, json=data, timeout=HTTP_TIMEOUT)
     
     if response.status_code == 200:
         print(f"✅ Datastore '{DATASTORE_ID}' created successfully!")
@@ -161,7 +156,7 @@ def get_datastore():
         "X-Goog-User-Project": PROJECT_ID
     }
     
-    response = requests.get(url, headers=headers)
+    response = get_http_session().get(url, headers=headers, timeout=HTTP_TIMEOUT)
     
     if response.status_code == 200:
         return response.json()
@@ -172,10 +167,8 @@ def get_datastore():
 
 def create_gcs_bucket():
     """Create a GCS bucket for storing the transcript documents."""
-    from google.cloud import storage
-    
     bucket_name = f"{PROJECT_ID}-transcript-patterns"
-    client = storage.Client(project=PROJECT_ID)
+    client = get_storage_client()
     
     # Check if bucket already exists
     try:
@@ -200,10 +193,8 @@ def create_gcs_bucket():
 
 def list_existing_blobs(bucket_name) -> Set[str]:
     """List all existing blobs in the bucket for efficient checking."""
-    from google.cloud import storage
-    
     print("📋 Listing existing files in GCS bucket...")
-    client = storage.Client(project=PROJECT_ID)
+    client = get_storage_client()
     bucket = client.bucket(bucket_name)
     
     existing_blobs = set()
@@ -218,43 +209,38 @@ def process_json_conversation(json_path):
     with open(json_path, 'r') as f:
         data = json.load(f)
     
-    # Format as dialogue with 3-turn sequences
-    formatted_content = []
     conversation = data.get('messages', data.get('conversation', []))
     
-    # Create overlapping 3-turn sequences for better pattern matching
-    for i in range(len(conversation) - 2):
-        sequence = []
-        for j in range(3):
-            if i + j < len(conversation):
-                msg = conversation[i + j]
-                role = msg.get('role', 'Unknown')
-                content = msg.get('content', msg.get('text', ''))
-                sequence.append(f"{role}: {content}")
-        
-        if len(sequence) >= 2:  # At least 2 turns
-            formatted_content.append("\n".join(sequence))
-            formatted_content.append("\n---\n")  # Separator between sequences
+    # Format each turn once; the overlapping windows below reuse the formatted lines
+    turns = [
+        f"{msg.get('role', 'Unknown')}: {msg.get('content', msg.get('text', ''))}"
+        for msg in conversation
+    ]
     
     # Add metadata about the session
     session_type = "PTSD" if "trauma" in json_path.lower() else "General"
-    formatted_content.insert(0, f"Session Type: {session_type}\n")
-    formatted_content.insert(1, f"File: {os.path.basename(json_path)}\n\n")
+    formatted_content = [
+        f"Session Type: {session_type}\n",
+        f"File: {os.path.basename(json_path)}\n\n",
+    ]
+    
+    # Create overlapping 3-turn sequences for better pattern matching
+    for i in range(len(turns) - 2):
+        formatted_content.append("\n".join(turns[i:i + 3]))
+        formatted_content.append("\n---\n")  # Separator between sequences
     
     return "\n".join(formatted_content)
 
 def process_pdf_transcript(pdf_path):
     """Extract text from PDF transcripts."""
     try:
+        import PyPDF2  # Only needed when PDFs are actually processed
+        
         with open(pdf_path, 'rb') as file:
             pdf_reader = PyPDF2.PdfReader(file)
-            text = []
-            
-            for page_num in range(len(pdf_reader.pages)):
-                page = pdf_reader.pages[page_num]
-                text.append(page.extract_text())
             
-            full_text = "\n".join(text)
+            # Iterate pages directly rather than re-indexing into the page list
+            full_text = "\n".join(page.extract_text() for page in pdf_reader.pages)
             
             # Add metadata
             session_type = "Beck CBT" if "BB3" in pdf_path else "PE/PTSD" if "PE" in pdf_path else "General"
@@ -265,11 +251,50 @@ def process_pdf_transcript(pdf_path):
         print(f"⚠️  Error processing PDF {pdf_path}: {e}")
         return None
 
+def process_and_upload_transcript(bucket, file_path, blob_name):
+    """Convert a transcript file to searchable text and upload it. Returns False if no content was extracted."""
+    if file_path.endswith('.pdf'):
+        print(f"  Processing PDF: {os.path.basename(file_path)}...")
+        content = process_pdf_transcript(file_path)
+    else:
+        print(f"  Processing JSON: {os.path.basename(file_path)}...")
+        content = process_json_conversation(file_path)
+    
+    if not content:
+        return False
+    
+    bucket.blob(blob_name).upload_from_string(content)
+    return True
+
+def collect_transcript_files(transcripts_dir):
+    """List (root, filename) pairs for every PDF and JSON transcript under the directory."""
+    return [
+        (root, filename)
+        for root, dirs, files in os.walk(transcripts_dir)
+        for filename in files
+        if filename.endswith(('.pdf', '.json'))
+    ]
+
+def report_pending_transcripts():
+    """Print which transcript files still need processing, without calling any Google Cloud APIs."""
+    transcripts_dir = "transcripts"
+    
+    if not os.path.exists(transcripts_dir):
+        print(f"❌ Transcripts directory '{transcripts_dir}' not found!")
+        return
+    
+    tracker = ProgressTracker()
+    all_files = collect_transcript_files(transcripts_dir)
+    relative_paths = [os.path.relpath(os.path.join(root, filename), transcripts_dir) for root, filename in all_files]
+    pending = [relative_path for relative_path in relative_paths if not tracker.is_completed(relative_path)]
+    
+    print(f"📊 {len(all_files)} transcript files found, {len(pending)} still to process:")
+    for relative_path in pending:
+        print(f"  - {relative_path}")
+
 def upload_transcripts_to_gcs_with_resume(bucket_name):
     """Upload transcript files to GCS bucket with resume capability."""
-    from google.cloud import storage
-    
-    client = storage.Client(project=PROJECT_ID)
+    client = get_storage_client()
     bucket = client.bucket(bucket_name)
     
     transcripts_dir = "transcripts"  # Since we're running from backend/rag
@@ -289,11 +314,7 @@ def upload_transcripts_to_gcs_with_resume(bucket_name):
     files_failed = 0
     
     # Collect all files to process
-    all_files = []
-    for root, dirs, files in os.walk(transcripts_dir):
-        for filename in files:
-            if filename.endswith(('.pdf', '.json')):
-                all_files.append((root, filename))
+    all_files = collect_transcript_files(transcripts_dir)
     
     total_files = len(all_files)
     print(f"\n📊 Found {total_files} files to process")
@@ -306,9 +327,11 @@ def upload_transcripts_to_gcs_with_resume(bucket_name):
         
         print(f"\n🔄 Processing batch {batch_start//batch_size + 1} ({batch_start+1}-{batch_end} of {total_files})")
         
+        pending = []
         for root, filename in batch:
             file_path = os.path.join(root, filename)
             relative_path = os.path.relpath(file_path, transcripts_dir)
+            blob_name = f"transcripts/{relative_path}.txt"
             
             # Check if already processed (from progress tracker)
             if tracker.is_completed(relative_path):
@@ -316,66 +339,48 @@ def upload_transcripts_to_gcs_with_resume(bucket_name):
                 files_skipped += 1
                 continue
             
-            try:
-                # Process PDFs
-                if filename.endswith('.pdf'):
-                    blob_name = f"transcripts/{relative_path}.txt"
-                    
-                    # Check if already exists in GCS
-                    if blob_name in existing_blobs:
-                        print(f"  ⏭️  Skipping PDF (exists in GCS): {filename}")
-                        tracker.mark_completed(relative_path)
-                        files_skipped += 1
-                        continue
-                    
-                    print(f"  Processing PDF: {filename}...")
-                    content = process_pdf_transcript(file_path)
-                    
-                    if content:
-                        blob = bucket.blob(blob_name)
-                        blob.upload_from_string(content)
+            # Check if already exists in GCS
+            if blob_name in existing_blobs:
+                print(f"  ⏭️  Skipping (exists in GCS): {filename}")
+                tracker.mark_completed(relative_path)
+                files_skipped += 1
+                continue
+            
+            pending.append((filename, file_path, relative_path, blob_name))
+        
+        # Uploads are network-bound and independent, so run the batch concurrently.
+        # Progress tracking stays on this thread as results come back.
+        with ThreadPoolExecutor(max_workers=UPLOAD_WORKERS) as executor:
+            futures = {
+                executor.submit(process_and_upload_transcript, bucket, file_path, blob_name): (filename, relative_path)
+                for filename, file_path, relative_path, blob_name in pending
+            }
+            for future in as_completed(futures):
+                filename, relative_path = futures[future]
+                try:
+                    if future.result():
                         tracker.mark_completed(relative_path)
                         files_uploaded += 1
                         print(f"    ✅ Uploaded: {filename}")
                     else:
                         files_failed += 1
-                        tracker.mark_failed(relative_path, "Failed to extract PDF content")
-                
-                # Process JSON conversations
-                elif filename.endswith('.json'):
-                    blob_name = f"transcripts/{relative_path}.txt"
-                    
-                    # Check if already exists in GCS
-                    if blob_name in existing_blobs:
-                        print(f"  ⏭️  Skipping JSON (exists in GCS): {filename}")
-                        tracker.mark_completed(relative_path)
-                        files_skipped += 1
-                        continue
-                    
-                    print(f"  Processing JSON: {filename}...")
-                    content = process_json_conversation(file_path)
-                    
-                    blob = bucket.blob(blob_name)
-                    blob.upload_from_string(content)
-                    tracker.mark_completed(relative_path)
-                    files_uploaded += 1
-                    print(f"    ✅ Uploaded: {filename}")
-                    
-            except Exception as e:
-                print(f"    ❌ Failed to process {filename}: {e}")
-                tracker.mark_failed(relative_path, str(e))
-                files_failed += 1
-                continue
+                        tracker.mark_failed(relative_path, "Failed to extract content")
+                except Exception as e:
+                    print(f"    ❌ Failed to process {filename}: {e}")
+                    tracker.mark_failed(relative_path, str(e))
+                    files_failed += 1
         
         # Save progress after each batch
         tracker.save_progress()
         print(f"  💾 Progress saved after batch")
     
-    print(f"\n📊 Upload Summary:")
-    print(f"  ✅ Newly uploaded: {files_uploaded}")
-    print(f"  ⏭️  Skipped (already processed): {files_skipped}")
-    print(f"  ❌ Failed: {files_failed}")
-    print(f"  📁 Total files: {total_files}")
+    print("\n".join([
+        f"\n📊 Upload Summary:",
+        f"  ✅ Newly uploaded: {files_uploaded}",
+        f"  ⏭️  Skipped (already processed): {files_skipped}",
+        f"  ❌ Failed: {files_failed}",
+        f"  📁 Total files: {total_files}",
+    ]))
     
     if files_failed > 0:
         print(f"\n⚠️  Failed files saved in progress tracker. Run again to retry.")
@@ -384,9 +389,7 @@ def upload_transcripts_to_gcs_with_resume(bucket_name):
 
 def create_pattern_library(bucket_name):
     """Create a pattern library document with key therapeutic moments."""
-    from google.cloud import storage
-    
-    client = storage.Client(project=PROJECT_ID)
+    client = get_storage_client()
     bucket = client.bucket(bucket_name)
     
     # Check if pattern library already exists
@@ -510,7 +513,7 @@ def import_documents_to_datastore(bucket_name):
     
     print(f"Importing documents from GCS to datastore...")
     
-    response = requests.post(url, headers=headers, json=data)
+    response = get_http_session().post(url, headers=headers, json=data, timeout=HTTP_TIMEOUT)
     
     if response.status_code == 200:
         operation = response.json()
@@ -529,30 +532,20 @@ def wait_for_operation(operation_name, timeout=600):
         "X-Goog-User-Project": PROJECT_ID
     }
     
-    start_time = time.time()
+    operation, error_response = poll_operation(operation_name, headers, timeout)
     
-    while time.time() - start_time < timeout:
-        url = f"https://discoveryengine.googleapis.com/v1/{operation_name}"
-        response = requests.get(url, headers=headers)
-        
-        if response.status_code == 200:
-            operation = response.json()
-            if operation.get("done"):
-                if "error" in operation:
-                    print(f"❌ Operation failed: {operation['error']}")
-                    return False
-                else:
-                    print(f"✅ Operation completed successfully!")
-                    return True
-        else:
-            print(f"❌ Error checking operation status: {response.status_code}")
-            return False
-        
-        print("⏳ Waiting for operation to complete...")
-        time.sleep(10)
+    if error_response is not None:
+        print(f"❌ Error checking operation status: {error_response.status_code}")
+        return False
+    if operation is None:
+        print(f"❌ Operation timed out after {timeout} seconds")
+        return False
+    if "error" in operation:
+        print(f"❌ Operation failed: {operation['error']}")
+        return False
     
-    print(f"❌ Operation timed out after {timeout} seconds")
-    return False
+    print(f"✅ Operation completed successfully!")
+    return True
 
 def update_backend_with_transcript_rag():
     """Update the therapy analysis function to include transcript RAG tool."""
@@ -565,16 +558,28 @@ def update_backend_with_transcript_rag():
     
     return datastore_path
 
-def main():
+def is_module_available(name):
+    """Check whether a module can be imported, without importing it."""
+    try:
+        return importlib.util.find_spec(name) is not None
+    except ModuleNotFoundError:  # Raised when a parent package (e.g. google) is missing
+        return False
+
+def parse_args():
+    """Parse command line options."""
+    parser = argparse.ArgumentParser(description="Set up the clinical transcript datastore, resuming any previous run.")
+    parser.add_argument("--reset", action="store_true", help="discard saved progress and start fresh")
+    parser.add_argument("--dry-run", action="store_true", help="list transcript files still to be processed and exit")
+    return parser.parse_args()
+
+def main(args):
     """Main function to set up the transcript RAG datastore."""
     
     print(f"🚀 Setting up Vertex AI Search datastore for Clinical Transcripts (Resumable Version)")
     print(f"Project ID: {PROJECT_ID}")
     print(f"Datastore ID: {DATASTORE_ID}\n")
     
-    # Check for --reset flag
-    import sys
-    if '--reset' in sys.argv:
+    if args.reset:
         tracker = ProgressTracker()
         tracker.reset()
         print("Progress has been reset. Starting fresh.\n")
@@ -628,15 +633,18 @@ def main():
         raise
 
 if __name__ == "__main__":
-    # Check for required libraries
-    try:
-        import google.auth
-        from google.cloud import storage
-        import PyPDF2
-    except ImportError:
+    args = parse_args()
+    
+    # A dry run only reads local files and progress, so it needs none of the cloud libraries
+    if args.dry_run:
+        report_pending_transcripts()
+        exit(0)
+    
+    # Check for required libraries without importing them
+    if not all(is_module_available(module) for module in ("google.auth", "google.cloud.storage", "requests", "PyPDF2")):
         print("Installing required dependencies...")
         os.system("pip install google-auth google-auth-httplib2 google-cloud-storage requests PyPDF2")
         print("Dependencies installed. Please run the script again.")
         exit(0)
     
-    main()
+    main(args)